@@ -0,0 +1,139 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+import create_update_set_and_upload_xml as deploy_script
+from extract_tf_vars_to_xml import write_xml
+from mock_servicenow import MockServiceNow, start_server
+
+"""
+End-to-end benchmark of the deploy path against mock_servicenow.py:
+ - Runs the full update set pipeline for 10/100/1000 generated variables
+ - Reports wall time, request count and bytes sent/received per run
+ - Compares minimal (projected) and full Table API payloads with --payload both
+ - Measures the Import Set load path instead of batched writes with --load import
+ - Optionally compares request/byte counts with a saved baseline (for CI)
+"""
+
+
+def run_once(num_vars, latency, error_rate, rate_limit, workdir, minimal_payload=True, load="batch"):
+    """Deploy num_vars generated locals to a fresh mock instance; returns the measurements"""
+    mock = MockServiceNow(latency=latency, error_rate=error_rate, rate_limit=rate_limit, seed=num_vars)
+    server, url = start_server(mock)
+
+    payload = "minimal" if minimal_payload else "full"
+    run_dir = os.path.join(workdir, f"run_{num_vars}_{payload}_{load}")
+    os.makedirs(run_dir, exist_ok=True)
+    xml_path = os.path.join(run_dir, "terraform_vars.xml")
+    write_xml({f"var_{i:04d}": f"value_{i}" for i in range(num_vars)}, {}, xml_path)
+
+    cwd = os.getcwd()
+    os.chdir(run_dir)  # exports and the lookup cache land in the scratch directory
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            variables = deploy_script.parse_xml_variables(xml_path)
+            mock.reset_stats()
+            start = time.perf_counter()
+            with deploy_script.ServiceNowClient(url, "admin", "admin", minimal_payload=minimal_payload) as client:
+                deploy_script.deploy(client, variables, xml_path=xml_path, import_set=load == "import")
+            wall = time.perf_counter() - start
+    finally:
+        os.chdir(cwd)
+        server.shutdown()
+        server.server_close()
+
+    created = sum(1 for r in mock.tables.get("item_option_new", {}).values() if r.get("active") == "true")
+    return {
+        "variables": num_vars,
+        "payload": payload,
+        "load": load,
+        "created": created,
+        "wall_s": round(wall, 3),
+        "requests": mock.stats["requests"],
+        "connections": mock.stats["connections"],
+        "bytes_in": mock.stats["bytes_in"],
+        "bytes_out": mock.stats["bytes_out"],
+    }
+
+
+def print_table(results):
+    print(f"{'vars':>6} {'payload':>8} {'load':>7} {'wall s':>8} {'requests':>9} {'conns':>6} "
+          f"{'bytes sent':>11} {'bytes recv':>11}")
+    for r in results:
+        print(f"{r['variables']:>6} {r['payload']:>8} {r['load']:>7} {r['wall_s']:>8.3f} {r['requests']:>9} {r['connections']:>6} "
+              f"{r['bytes_in']:>11} {r['bytes_out']:>11}")
+
+
+def check_baseline(results, baseline_path, tolerance):
+    """Return a list of regressions against the baseline request/byte counts"""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {(r["variables"], r.get("payload", "minimal"), r.get("load", "batch")): r for r in json.load(f)}
+
+    regressions = []
+    for r in results:
+        base = baseline.get((r["variables"], r["payload"], r["load"]))
+        if base is None:
+            continue
+        # Wall time is too noisy on shared runners; requests and bytes are deterministic enough
+        for key in ("requests", "bytes_in", "bytes_out"):
+            limit = base[key] * (1 + tolerance)
+            if r[key] > limit:
+                regressions.append(f"{r['variables']} vars ({r['payload']}, {r['load']}): {key} {r[key]} > baseline {base[key]} (+{tolerance:.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ServiceNow deploy path against a local mock")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000], help="variable counts to deploy")
+    parser.add_argument("--latency", type=float, default=0.02, help="mock latency per request in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of mock requests answered with 503")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="mock requests per second before 429s")
+    parser.add_argument("--payload", choices=("minimal", "full", "both"), default="minimal",
+                        help="Table API responses projected to the fields read (minimal), full records, or both")
+    parser.add_argument("--load", choices=("batch", "import", "both"), default="batch",
+                        help="create variables with batched Table API writes, one Import Set upload, or both")
+    parser.add_argument("--json", dest="json_path", help="write results to this JSON file")
+    parser.add_argument("--check", metavar="BASELINE", help="fail if requests/bytes regress against a results JSON")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed growth over the baseline (default 0.2)")
+    args = parser.parse_args()
+
+    # Retries against injected errors should not dominate the timings
+    deploy_script.RETRY_BACKOFF = min(deploy_script.RETRY_BACKOFF, 0.05)
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        deploy_script.LOOKUP_CACHE_PATH = os.path.join(workdir, "lookup_cache.json")
+        modes = {"minimal": [True], "full": [False], "both": [False, True]}[args.payload]
+        loads = ["batch", "import"] if args.load == "both" else [args.load]
+        for size in args.sizes:
+            for load in loads:
+                for minimal in modes:
+                    print(f"⏱️  Deploying {size} variables ({'minimal' if minimal else 'full'} payload, {load})...")
+                    results.append(run_once(size, args.latency, args.error_rate, args.rate_limit, workdir,
+                                            minimal, load))
+
+    print()
+    print_table(results)
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n📄 Results written to {args.json_path}")
+
+    if args.check:
+        regressions = check_baseline(results, args.check, args.tolerance)
+        if regressions:
+            print("\n❌ Benchmark regressions:")
+            for line in regressions:
+                print(f"   {line}")
+            sys.exit(1)
+        print("\n✅ No request/byte regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
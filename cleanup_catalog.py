@@ -0,0 +1,200 @@
+import argparse
+import sys
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta, timezone
+
+import requests
+
+import create_update_set_and_upload_xml as deploy_script
+from instrumentation import RECORDER, add_metrics_arguments
+
+"""
+Prune what repeated deploys leave behind on the instance:
+ - Pages through TerraformCatalog_ update sets and the deployed catalog items
+ - Keeps the newest N of each and anything created in the last D days
+ - Deletes the rest (or deactivates them with --deactivate), including the
+   variables of every pruned item, on a bounded pool of concurrent requests
+ - --dry-run only reports what would be removed
+"""
+
+UPDATE_SET_PREFIX = "TerraformCatalog_"
+
+# Retention policy defaults
+KEEP = 5
+OLDER_THAN_DAYS = 30
+
+UPDATE_SET_FIELDS = ("sys_id", "name", "sys_created_on", "state")
+ITEM_FIELDS = ("sys_id", "name", "sys_created_on", "active", "sys_update_set")
+VARIABLE_FIELDS = ("sys_id", "name")
+
+TABLE_LABELS = {
+    "sys_update_set": "update sets",
+    "sc_cat_item": "catalog items",
+    "item_option_new": "variables",
+}
+
+
+def reference_value(value):
+    """Reference fields come back as {"link", "value"} unless the link is excluded"""
+    return value.get("value", "") if isinstance(value, dict) else value or ""
+
+
+def select_stale(records, keep, cutoff, stats, kept=None, protect=None):
+    """
+    Apply the retention policy to records arriving newest first: the first `keep`
+    records, anything created at or after cutoff and anything protect(record)
+    accepts are kept (their sys_ids are added to kept); every other record is yielded.
+    """
+    for index, record in enumerate(records):
+        if (index < keep or record.get("sys_created_on", "") >= cutoff
+                or (protect is not None and protect(record))):
+            stats["kept"] += 1
+            if kept is not None:
+                kept.add(record["sys_id"])
+            continue
+        yield record
+
+
+def stale_records(client, item_name, keep, cutoff, deactivate, stats, page_size=deploy_script.PAGE_SIZE,
+                  dry_run=False):
+    """
+    Yield (table, record) for everything the retention policy removes: stale
+    update sets first, then stale items, each preceded by its variables when
+    deleting (a dry run only counts them into record["variables"]). Items that
+    belong to a kept update set are never removed.
+    """
+    state_filter = "^state!=ignore" if deactivate else ""
+    update_sets = deploy_script.iter_records(
+        client, "sys_update_set",
+        f"nameSTARTSWITH{UPDATE_SET_PREFIX}{state_filter}^ORDERBYsys_created_on",
+        UPDATE_SET_FIELDS, page_size
+    )
+    kept_sets = set()
+    for record in select_stale(update_sets, keep, cutoff, stats["sys_update_set"], kept=kept_sets):
+        yield "sys_update_set", record
+
+    active_filter = "^active=true" if deactivate else ""
+    items = deploy_script.iter_records(
+        client, "sc_cat_item", f"name={item_name}{active_filter}^ORDERBYsys_created_on", ITEM_FIELDS, page_size
+    )
+    # Every update set has been read by now, so kept_sets is complete
+    in_kept_set = lambda item: reference_value(item.get("sys_update_set")) in kept_sets
+    for record in select_stale(items, keep, cutoff, stats["sc_cat_item"], protect=in_kept_set):
+        # An inactive item hides its variables; a deleted one would leave them orphaned
+        if not deactivate and dry_run:
+            record["variables"] = deploy_script.count_records(client, "item_option_new", f"cat_item={record['sys_id']}")
+        elif not deactivate:
+            variables = deploy_script.iter_records(
+                client, "item_option_new", f"cat_item={record['sys_id']}^ORDERBYorder", VARIABLE_FIELDS, page_size
+            )
+            for variable in variables:
+                yield "item_option_new", variable
+        yield "sc_cat_item", record
+
+
+def prune_record(client, table, record, deactivate):
+    """Delete one record, or deactivate it (update sets are set to "ignore")"""
+    url = f"/api/now/table/{table}/{record['sys_id']}"
+    if deactivate:
+        payload = {"state": "ignore"} if table == "sys_update_set" else {"active": "false"}
+        resp = client.patch(url, json=payload, fields=("sys_id",))
+    else:
+        resp = client.delete(url)
+    # 404: already gone, e.g. a DELETE that was retried after the instance processed it
+    if resp.status_code != 404:
+        resp.raise_for_status()
+
+
+def prune(client, records, deactivate, max_in_flight, stats, dry_run=False):
+    """
+    Remove every (table, record) the generator yields. At most max_in_flight
+    requests are pending at once, so records are only read from the instance
+    as fast as they are removed.
+    """
+    verb = "Would deactivate" if deactivate else "Would delete"
+
+    def collect(futures, pending):
+        for future in futures:
+            table, record = pending.pop(future)
+            try:
+                future.result()
+            except requests.RequestException as e:
+                stats[table]["failed"] += 1
+                print(f"   ❌ {table} {record.get('name', '')} ({record['sys_id']}): {e}")
+            else:
+                stats[table]["removed"] += 1
+
+    with ThreadPoolExecutor(max_workers=max(1, max_in_flight)) as pool:
+        pending = {}
+        for table, record in records:
+            if dry_run:
+                stats[table]["removed"] += 1
+                stats["item_option_new"]["removed"] += record.get("variables", 0)
+                extra = f", {record['variables']} variable(s)" if "variables" in record else ""
+                print(f"   🗑️  {verb} {table} {record.get('name', '')} "
+                      f"(created {record.get('sys_created_on', '?')}, {record['sys_id']}{extra})")
+                continue
+            if len(pending) >= max_in_flight:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done, pending)
+            pending[pool.submit(prune_record, client, table, record, deactivate)] = (table, record)
+        collect(list(pending), pending)
+
+
+def print_cleanup_summary(stats, dry_run, deactivate):
+    print("\n" + "=" * 60)
+    print("🧹 CLEANUP DRY RUN" if dry_run else "🧹 CLEANUP SUMMARY")
+    print("=" * 60)
+    action = "deactivate" if deactivate else "delete"
+    removed = f"would {action}" if dry_run else f"{action}d"
+    print(f"{'':<14} {'kept':>8} {removed:>16} {'failed':>8}")
+    for table, label in TABLE_LABELS.items():
+        row = stats[table]
+        kept = row["kept"] if table != "item_option_new" else "-"
+        print(f"{label:<14} {kept:>8} {row['removed']:>16} {row['failed']:>8}")
+    print("=" * 60)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Delete or deactivate old TerraformCatalog_ update sets and catalog items"
+    )
+    parser.add_argument("--keep", type=int, default=KEEP,
+                        help=f"always keep the newest N update sets and items (default: {KEEP})")
+    parser.add_argument("--older-than", type=float, default=OLDER_THAN_DAYS, metavar="DAYS",
+                        help=f"only remove records created more than DAYS days ago (default: {OLDER_THAN_DAYS})")
+    parser.add_argument("--item-name", default=deploy_script.CATALOG_ITEM_CONFIG["name"],
+                        help="catalog item name to prune (default: %(default)s)")
+    parser.add_argument("--deactivate", action="store_true",
+                        help="deactivate items and set update sets to 'ignore' instead of deleting them")
+    parser.add_argument("--dry-run", action="store_true", help="report what would be removed without changing anything")
+    parser.add_argument("--max-in-flight", type=int, default=deploy_script.MAX_IN_FLIGHT,
+                        help=f"concurrent delete/update requests (default: {deploy_script.MAX_IN_FLIGHT})")
+    parser.add_argument("--page-size", type=int, default=deploy_script.PAGE_SIZE,
+                        help=f"records read per request (default: {deploy_script.PAGE_SIZE})")
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=args.older_than)).strftime("%Y-%m-%d %H:%M:%S")
+    stats = {table: {"kept": 0, "removed": 0, "failed": 0} for table in TABLE_LABELS}
+
+    print(f"🔗 Connecting to {deploy_script.INSTANCE_URL} as {deploy_script.USERNAME}...")
+    print(f"🧹 Keeping the newest {args.keep} and anything created after {cutoff} UTC"
+          f"{' (dry run)' if args.dry_run else ''}\n")
+    try:
+        with deploy_script.ServiceNowClient(deploy_script.INSTANCE_URL, deploy_script.USERNAME,
+                                            deploy_script.PASSWORD) as client:
+            records = stale_records(client, args.item_name, max(0, args.keep), cutoff, args.deactivate, stats,
+                                    max(1, args.page_size), args.dry_run)
+            prune(client, records, args.deactivate, args.max_in_flight, stats, args.dry_run)
+    finally:
+        RECORDER.print_summary()
+        RECORDER.write(args.metrics_jsonl, args.metrics_openmetrics)
+
+    print_cleanup_summary(stats, args.dry_run, args.deactivate)
+    if any(row["failed"] for row in stats.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,124 @@
 import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
 from requests.auth import HTTPBasicAuth
+from requests.structures import CaseInsensitiveDict
 from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlencode, urlsplit
 import xml.etree.ElementTree as ET
+import argparse
+import base64
+import contextvars
+import gzip
+import hashlib
+import io
+import json
 import os
+import random
+import shutil
 import sys
+import tempfile
+import threading
 import time
+import uuid
+from contextlib import contextmanager, redirect_stdout
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed
+from concurrent.futures import wait as wait_futures
+
+from extract_tf_vars_to_xml import (
+    SENSITIVE_PROVIDER_KEYS, SKIPPED_PROVIDER_KEYS,
+    discover_tf_files, extract_files, merge_results, parse_selector, prune_cache, write_xml
+)
+from instrumentation import RECORDER, add_metrics_arguments, endpoint_name, timed_step
 
 # =========================================================
 # 🔐 SERVICE NOW LOGIN DETAILS
 # =========================================================
 
-import os
-   
 INSTANCE_URL = os.environ.get("INSTANCE_URL", "https://dev219690.service-now.com")
 USERNAME = os.environ.get("USERNAME", "admin")
 PASSWORD = os.environ.get("PASSWORD", "")
 
+# --targets: concurrent deploys, each target's export lands in EXPORT_ROOT/<target name>
+MAX_TARGETS_IN_FLIGHT = int(os.environ.get("SN_MAX_TARGETS", "4"))
+EXPORT_ROOT = "exports"
+
+# --manifest: catalog items built at the same time, and where each stack's XML artifact is written
+MAX_ITEMS_IN_FLIGHT = int(os.environ.get("SN_MAX_ITEMS", "4"))
+BULK_XML_DIR = "bulk_xml"
+
+# =========================================================
+# 🌐 HTTP CONNECTION SETTINGS
+# =========================================================
+
+POOL_SIZE = int(os.environ.get("SN_POOL_SIZE", "10"))
+REQUEST_TIMEOUT = 30
+
+# Variables per ServiceNow Batch API call (1 = one POST per variable)
+BATCH_SIZE = int(os.environ.get("SN_BATCH_SIZE", "50"))
+BATCH_URL = "/api/now/v1/batch"
+
+# Concurrent variable requests, and a per-instance request rate cap (0 = unlimited)
+MAX_IN_FLIGHT = int(os.environ.get("SN_MAX_IN_FLIGHT", "8"))
+RATE_LIMIT = float(os.environ.get("SN_RATE_LIMIT", "0"))
+
+# Records per page when walking a large result set (iter_records)
+PAGE_SIZE = int(os.environ.get("SN_PAGE_SIZE", "200"))
+
+# Catalog/category sys_id cache (seconds before a lookup is repeated)
+LOOKUP_CACHE_PATH = os.environ.get("SN_LOOKUP_CACHE", ".sn_lookup_cache.json")
+LOOKUP_CACHE_TTL = float(os.environ.get("SN_LOOKUP_TTL", "86400"))
+LOOKUP_QUERY_LIMIT = 1000
+
+# Checkpoints of the running deploy, kept after a failure so --resume can continue it
+JOURNAL_PATH = os.environ.get("SN_JOURNAL", ".sn_deploy_journal.json")
+
+# Update set export is streamed to disk in chunks of this size
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+# Attachment uploads: minimum read timeout and the slowest upload rate tolerated (bytes/s)
+ATTACH_TIMEOUT = float(os.environ.get("SN_ATTACH_TIMEOUT", "60"))
+ATTACH_MIN_RATE = 256 * 1024
+
+# item_option_new fields compared by --sync
+SYNC_FIELDS = ("name", "question_text", "type", "mandatory", "order", "default_value")
+
+# Retries for throttled (429) and transient (5xx/connection) failures
+MAX_RETRIES = int(os.environ.get("SN_MAX_RETRIES", "5"))
+RETRY_BACKOFF = float(os.environ.get("SN_RETRY_BACKOFF", "0.5"))
+RETRY_MAX_DELAY = 30.0
+RETRY_STATUSES = {429, 502, 503, 504}
+# Statuses that leave a non-idempotent write in doubt; 429 is already retried inside request()
+DEDUPE_RETRY_STATUSES = RETRY_STATUSES - {429}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "PATCH", "DELETE"}
+
+# Ask the Table API for only the fields each caller reads, without reference links (SN_MINIMAL_PAYLOAD=0 to disable)
+MINIMAL_PAYLOAD = os.environ.get("SN_MINIMAL_PAYLOAD", "1") != "0"
+
+# Deploy steps that may run at the same time once their inputs exist
+STEP_WORKERS = int(os.environ.get("SN_STEP_WORKERS", "4"))
+
+# Upper bound on readiness polling between steps
+POLL_TIMEOUT = float(os.environ.get("SN_POLL_TIMEOUT", "30"))
+
+# --import-set: staging table whose transform map writes item_option_new (columns are u_<field>)
+IMPORT_SET_TABLE = os.environ.get("SN_IMPORT_TABLE", "u_tf_catalog_variable_import")
+IMPORT_TIMEOUT = float(os.environ.get("SN_IMPORT_TIMEOUT", "300"))
+IMPORT_DONE_STATES = {"inserted", "updated", "ignored", "skipped", "error"}
+
+# --plan: round-trip time the time estimate is quoted at
+PLAN_RTT = float(os.environ.get("SN_PLAN_RTT", "0.15"))
+
 # =========================================================
 # 📄 XML FILE PATH
 # =========================================================
 
 XML_PATH = "terraform_vars.xml"
 
+# Parsed-file cache shared with extract_tf_vars_to_xml.py (used by --from-tf)
+TF_CACHE_DIR = ".tf_extract_cache"
+TF_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
 # =========================================================
 # 📋 CATALOG ITEM CONFIGURATION
 # =========================================================
@@ -38,6 +135,213 @@ CATALOG_ITEM_CONFIG = {
 # =========================================================
 
 
+def parse_retry_after(value):
+    """Retry-After as seconds; accepts delta-seconds or an HTTP date"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+def request_body_size(prepared):
+    """Bytes in a prepared request body (file bodies are counted by their Content-Length)"""
+    body = prepared.body
+    if body is None:
+        return 0
+    if isinstance(body, (bytes, str)):
+        return len(body)
+    return int(prepared.headers.get("Content-Length") or 0)
+
+
+def response_body_size(resp, streamed):
+    """Bytes in a response body; streamed bodies are not read here, so trust Content-Length"""
+    if streamed:
+        return int(resp.headers.get("Content-Length") or 0)
+    return len(resp.content)
+
+
+class RateLimiter:
+    """Token bucket shared by all threads using one client"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+        self.paused_until = 0.0
+
+    def pause(self, seconds):
+        """Hold every caller back, e.g. after the instance answered 429 Retry-After"""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                elif not self.rate:
+                    return
+                else:
+                    wait = None
+            if wait is not None:
+                time.sleep(wait)
+                continue
+
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class ServiceNowClient:
+    """Keep-alive HTTP session shared by every call against one instance"""
+
+    def __init__(self, instance_url, username, password, pool_size=POOL_SIZE, timeout=REQUEST_TIMEOUT,
+                 rate_limit=RATE_LIMIT, max_retries=MAX_RETRIES, minimal_payload=MINIMAL_PAYLOAD,
+                 lookup_cache_path=None):
+        self.instance_url = instance_url.rstrip("/")
+        self.username = username
+        self.timeout = timeout
+        self.limiter = RateLimiter(rate_limit)
+        self.max_retries = max_retries
+        self.minimal_payload = minimal_payload
+        # None: LOOKUP_CACHE_PATH, read when the cache is used
+        self.lookup_cache_path = lookup_cache_path
+
+        self.session = requests.Session()
+        self.session.auth = HTTPBasicAuth(username, password)
+        self.session.headers.update({
+            "Accept": "application/json",
+            "X-UserToken": "no-check",
+            "Connection": "keep-alive"
+        })
+
+        # One pool per scheme; callers block for a free connection instead of opening extras
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def retry_delay(self, attempt, resp=None):
+        """Seconds to wait before retry number `attempt` (0-based): Retry-After or full-jitter backoff"""
+        retry_after = parse_retry_after(resp.headers.get("Retry-After")) if resp is not None else None
+        if retry_after is not None:
+            return min(retry_after, RETRY_MAX_DELAY) + random.uniform(0, RETRY_BACKOFF)
+        return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BACKOFF * (2 ** attempt)))
+
+    def projection(self, fields, method="GET"):
+        """Table API params limiting a response to `fields`; empty when minimal payloads are off"""
+        if not fields or not self.minimal_payload:
+            return {}
+        params = {"sysparm_fields": ",".join(fields), "sysparm_exclude_reference_link": "true"}
+        if method.upper() == "GET":
+            # Only list reads carry the Link pagination header
+            params["sysparm_suppress_pagination_header"] = "true"
+        return params
+
+    def projected_path(self, path, fields, method="GET"):
+        """path with the projection in its query string, for Batch API sub-requests"""
+        params = self.projection(fields, method)
+        if not params:
+            return path
+        return f"{path}{'&' if '?' in path else '?'}{urlencode(params)}"
+
+    def request(self, method, path, idempotent=None, fields=None, **kwargs):
+        """
+        Send a request to a path on the instance, e.g. /api/now/table/sc_catalog.
+        fields lists the record fields the caller reads (see projection()).
+        429s are always retried (the instance did not process the request);
+        5xx and connection errors only when the method is idempotent or the
+        caller passes idempotent=True.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        if fields:
+            kwargs["params"] = {**self.projection(fields, method), **(kwargs.get("params") or {})}
+        if idempotent is None:
+            idempotent = method.upper() in IDEMPOTENT_METHODS
+
+        # File bodies must be rewound before they can be sent again
+        body = kwargs.get("data")
+        body_pos = body.tell() if hasattr(body, "seek") and hasattr(body, "tell") else None
+
+        # One timing record per call, covering every retry and backoff sleep
+        started = time.perf_counter()
+        attempt = 0
+        while True:
+            if attempt and body_pos is not None:
+                body.seek(body_pos)
+            self.limiter.acquire()
+            try:
+                resp = self.session.request(method, f"{self.instance_url}{path}", **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if not idempotent or attempt >= self.max_retries:
+                    RECORDER.record_http(method, path, time.perf_counter() - started, retries=attempt,
+                                         instance=self.instance_url)
+                    raise
+                delay = self.retry_delay(attempt)
+            else:
+                retryable = resp.status_code == 429 or (idempotent and resp.status_code in RETRY_STATUSES)
+                if not retryable or attempt >= self.max_retries:
+                    resp.retries = attempt
+                    RECORDER.record_http(
+                        method, path, time.perf_counter() - started,
+                        status=resp.status_code,
+                        bytes_out=request_body_size(resp.request),
+                        bytes_in=response_body_size(resp, kwargs.get("stream", False)),
+                        retries=attempt,
+                        instance=self.instance_url
+                    )
+                    return resp
+                delay = self.retry_delay(attempt, resp)
+                if resp.status_code == 429:
+                    self.limiter.pause(delay)
+                # Drain the error body so the keep-alive connection goes back to the pool
+                resp.content
+
+            attempt += 1
+            print(f"   🔁 {method} {path.split('?')[0]} retry {attempt}/{self.max_retries} in {delay:.1f}s")
+            time.sleep(delay)
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+    def patch(self, path, **kwargs):
+        return self.request("PATCH", path, **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.request("DELETE", path, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+@timed_step()
 def validate_xml(xml_path):
     """Validate XML file exists and can be parsed"""
     if not os.path.isfile(xml_path):
@@ -53,15 +357,17 @@ def validate_xml(xml_path):
         sys.exit(1)
 
 
-def parse_xml_variables():
+@timed_step()
+def parse_xml_variables(xml_path=XML_PATH):
     """Parse terraform_vars.xml and extract variables for catalog"""
-    print("📖 Reading terraform_vars.xml...")
+    print(f"📖 Reading {os.path.basename(xml_path)}...")
     
-    tree = ET.parse(XML_PATH)
+    tree = ET.parse(xml_path)
     root = tree.getroot()
     
-    variables = []
-    order = 100
+    locals_dict = {}
+    provider_dict = {}
+    sensitive = set()
     
     # Parse Locals section
     locals_section = root.find('Locals')
@@ -69,23 +375,8 @@ def parse_xml_variables():
         for variable in locals_section.findall('Variable'):
             name_elem = variable.find('Name')
             value_elem = variable.find('Value')
-            type_elem = variable.find('Type')
-            
             if name_elem is not None and name_elem.text:
-                var_config = {
-                    "name": name_elem.text,
-                    "question_text": name_elem.text.replace('_', ' ').title(),
-                    "type": "8",  # Single Line Text
-                    "mandatory": "false",
-                    "order": str(order)
-                }
-                
-                if value_elem is not None and value_elem.text:
-                    var_config["default_value"] = value_elem.text
-                
-                variables.append(var_config)
-                order += 100
-                print(f"   ✅ Found local variable: {name_elem.text}")
+                locals_dict[name_elem.text] = value_elem.text if value_elem is not None else None
     
     # Parse Provider settings
     provider_section = root.find('Provider')
@@ -94,37 +385,175 @@ def parse_xml_variables():
             name_elem = setting.find('Name')
             value_elem = setting.find('Value')
             sensitive_elem = setting.find('Sensitive')
-            
             if name_elem is not None and name_elem.text:
-                # Skip sensitive fields
-                is_sensitive = sensitive_elem is not None and sensitive_elem.text == "true"
-                if is_sensitive:
-                    print(f"   ⚠️  Skipping sensitive field: {name_elem.text}")
-                    continue
-                
-                var_config = {
-                    "name": f"provider_{name_elem.text}",
-                    "question_text": f"Provider: {name_elem.text.replace('_', ' ').title()}",
-                    "type": "8",  # Single Line Text
-                    "mandatory": "false",
-                    "order": str(order)
-                }
-                
-                if value_elem is not None and value_elem.text:
-                    var_config["default_value"] = value_elem.text
-                
-                variables.append(var_config)
-                order += 100
-                print(f"   ✅ Found provider setting: {name_elem.text}")
+                provider_dict[name_elem.text] = value_elem.text if value_elem is not None else None
+                if sensitive_elem is not None and sensitive_elem.text == "true":
+                    sensitive.add(name_elem.text)
+    
+    return variables_from_dicts(locals_dict, provider_dict, sensitive)
+
+
+@timed_step()
+def variables_from_dicts(locals_dict, provider_dict, sensitive=()):
+    """
+    Build catalog variable definitions from extracted locals/provider settings.
+    Values are rendered the way terraform_vars.xml stores them (str(v)), so the
+    in-memory pipeline and the XML round trip produce identical variables.
+    """
+    variables = []
+    order = 100
+    
+    for name, value in locals_dict.items():
+        var_config = {
+            "name": name,
+            "question_text": name.replace('_', ' ').title(),
+            "type": "8",  # Single Line Text
+            "mandatory": "false",
+            "order": str(order)
+        }
+        
+        if value is not None and str(value):
+            var_config["default_value"] = str(value)
+        
+        variables.append(var_config)
+        order += 100
+        print(f"   ✅ Found local variable: {name}")
+    
+    for name, value in provider_dict.items():
+        # Skip sensitive fields
+        if name in sensitive:
+            print(f"   ⚠️  Skipping sensitive field: {name}")
+            continue
+        
+        var_config = {
+            "name": f"provider_{name}",
+            "question_text": f"Provider: {name.replace('_', ' ').title()}",
+            "type": "8",  # Single Line Text
+            "mandatory": "false",
+            "order": str(order)
+        }
+        
+        if value is not None and str(value):
+            var_config["default_value"] = str(value)
+        
+        variables.append(var_config)
+        order += 100
+        print(f"   ✅ Found provider setting: {name}")
     
     print(f"📊 Total variables extracted: {len(variables)}")
     return variables
 
 
-def create_update_set():
-    """Create a new update set"""
-    url = f"{INSTANCE_URL}/api/now/table/sys_update_set"
+def extract_variables(tf_paths, jobs=None, xml_path=XML_PATH, selectors=()):
+    """
+    Run the extractor in-process and build the catalog variables straight from
+    its locals/provider dicts, plus any values chosen by selectors (see
+    extract_tf_vars_to_xml.parse_selector). terraform_vars.xml is still written
+    as an artifact, on a background thread; returns (variables, future) and the
+    future must be waited on before the XML is attached.
+    """
+    tf_files, missing = discover_tf_files(tf_paths)
+    if missing or not tf_files:
+        for item in missing or tf_paths:
+            print(f"❌ Terraform file not found: {item}")
+        sys.exit(1)
+
+    print(f"📖 Extracting {len(tf_files)} .tf file(s)...")
+    results = extract_files(tf_files, jobs, TF_CACHE_DIR, selectors)
+    prune_cache(TF_CACHE_DIR, TF_CACHE_MAX_BYTES)
+    locals_dict, provider_dict, conflicts = merge_results(results)
+    for section, key, first, second in conflicts:
+        print(f"   ⚠️  Conflicting {section} key '{key}': {first} overridden by {second}")
 
+    writer = ThreadPoolExecutor(max_workers=1)
+    xml_pending = writer.submit(write_xml, locals_dict, provider_dict, xml_path)
+    writer.shutdown(wait=False)
+
+    provider_dict = {k: v for k, v in provider_dict.items() if k not in SKIPPED_PROVIDER_KEYS}
+    variables = variables_from_dicts(locals_dict, provider_dict, SENSITIVE_PROVIDER_KEYS)
+    return variables, xml_pending
+
+
+def load_manifest(path):
+    """
+    Read a bulk manifest mapping Terraform stacks to catalog items:
+    {"items": [{"name": "Web VM", "tf": ["stacks/web"], "short_description": "...", ...}, ...]}
+    "tf" paths are relative to the manifest; missing item fields fall back to CATALOG_ITEM_CONFIG.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"❌ Cannot read manifest {path}: {e}")
+        sys.exit(1)
+
+    entries = manifest.get("items") if isinstance(manifest, dict) else None
+    if not isinstance(entries, list) or not entries:
+        print(f"❌ Manifest {path} must contain a non-empty \"items\" list")
+        sys.exit(1)
+
+    base_dir = os.path.dirname(os.path.abspath(path))
+    items = []
+    names = set()
+    for i, entry in enumerate(entries, 1):
+        if not isinstance(entry, dict) or not entry.get("name") or not entry.get("tf"):
+            print(f"❌ Manifest item #{i} needs a \"name\" and \"tf\" paths")
+            sys.exit(1)
+        if entry["name"] in names:
+            print(f"❌ Duplicate catalog item name '{entry['name']}' in {path}")
+            sys.exit(1)
+        names.add(entry["name"])
+
+        tf_paths = entry["tf"] if isinstance(entry["tf"], list) else [entry["tf"]]
+        config = dict(CATALOG_ITEM_CONFIG)
+        config.update({k: v for k, v in entry.items() if k in CATALOG_ITEM_CONFIG})
+        slug = "".join(c if c.isalnum() else "_" for c in entry["name"]).strip("_").lower()
+        items.append({
+            "config": config,
+            "tf_paths": [os.path.join(base_dir, p) for p in tf_paths],
+            "xml_path": os.path.join(BULK_XML_DIR, f"{i:03d}_{slug}.xml")
+        })
+    return items
+
+
+def extract_manifest_items(items, jobs=None):
+    """
+    Extract every stack in one process pool (files shared by stacks are parsed
+    once), then fill in each item's variables. Each item's XML artifact is
+    written in the background; item["xml_pending"] finishes writing it.
+    """
+    for item in items:
+        tf_files, missing = discover_tf_files(item["tf_paths"])
+        if missing or not tf_files:
+            for path in missing or item["tf_paths"]:
+                print(f"❌ {item['config']['name']}: Terraform file not found: {path}")
+            sys.exit(1)
+        item["tf_files"] = tf_files
+
+    unique_files = sorted({path for item in items for path in item["tf_files"]})
+    print(f"📖 Extracting {len(unique_files)} .tf file(s) for {len(items)} catalog item(s)...")
+    by_path = dict(zip(unique_files, extract_files(unique_files, jobs, TF_CACHE_DIR)))
+    prune_cache(TF_CACHE_DIR, TF_CACHE_MAX_BYTES)
+
+    os.makedirs(BULK_XML_DIR, exist_ok=True)
+    writer = ThreadPoolExecutor(max_workers=1)
+    for item in items:
+        locals_dict, provider_dict, conflicts = merge_results([by_path[p] for p in item["tf_files"]])
+        for section, key, first, second in conflicts:
+            print(f"   ⚠️  {item['config']['name']}: conflicting {section} key '{key}': "
+                  f"{first} overridden by {second}")
+        item["xml_pending"] = writer.submit(write_xml, locals_dict, provider_dict, item["xml_path"])
+
+        print(f"📋 {item['config']['name']}:")
+        provider_dict = {k: v for k, v in provider_dict.items() if k not in SKIPPED_PROVIDER_KEYS}
+        item["variables"] = variables_from_dicts(locals_dict, provider_dict, SENSITIVE_PROVIDER_KEYS)
+    writer.shutdown(wait=False)
+    return items
+
+
+@timed_step()
+def create_update_set(client):
+    """Create a new update set"""
     timestamp = datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S")
     name = f"TerraformCatalog_{timestamp}"
 
@@ -134,26 +563,13 @@ def create_update_set():
         "state": "in progress"
     }
 
-    headers = {
-        "Accept": "application/json",
-        "Content-Type": "application/json",
-        "X-UserToken": "no-check"
-    }
-
-    resp = requests.post(
-        url,
-        json=payload,
-        auth=HTTPBasicAuth(USERNAME, PASSWORD),
-        headers=headers,
-        timeout=30
-    )
-
-    print(f"Create Update Set - Status: {resp.status_code}")
-    if resp.status_code != 201:
-        print(f"Response: {resp.text}")
-    
-    resp.raise_for_status()
-    result = resp.json()["result"]
+    # Update set names are unique per run, so a retried create can be deduplicated by name
+    try:
+        result = create_record_once(client, "sys_update_set", payload, f"name={name}")
+    except requests.HTTPError as e:
+        print(f"Create Update Set - Status: {e.response.status_code}")
+        print(f"Response: {e.response.text}")
+        raise
 
     print("✅ Update Set created")
     print(f"   sys_id: {result['sys_id']}")
@@ -162,9 +578,10 @@ def create_update_set():
     return result["sys_id"], result["name"]
 
 
-def set_current_update_set(update_set_sys_id):
+@timed_step()
+def set_current_update_set(client, update_set_sys_id):
     """Set the current update set for the session"""
-    url = f"{INSTANCE_URL}/api/now/table/sys_user_preference"
+    url = "/api/now/table/sys_user_preference"
 
     payload = {
         "user": "",
@@ -172,19 +589,7 @@ def set_current_update_set(update_set_sys_id):
         "value": update_set_sys_id
     }
 
-    headers = {
-        "Accept": "application/json",
-        "Content-Type": "application/json",
-        "X-UserToken": "no-check"
-    }
-
-    resp = requests.post(
-        url,
-        json=payload,
-        auth=HTTPBasicAuth(USERNAME, PASSWORD),
-        headers=headers,
-        timeout=30
-    )
+    resp = client.post(url, json=payload, fields=("sys_id",))
 
     if resp.status_code in [200, 201]:
         print("✅ Set as current update set")
@@ -192,223 +597,674 @@ def set_current_update_set(update_set_sys_id):
         print(f"⚠️  Could not set current update set: {resp.status_code}")
 
 
-def get_catalog_sys_id(catalog_name="Service Catalog"):
-    """Get the sys_id of a catalog"""
-    url = f"{INSTANCE_URL}/api/now/table/sc_catalog"
+_lookup_cache_lock = threading.Lock()
 
-    params = {
-        "sysparm_query": f"title={catalog_name}",
-        "sysparm_limit": 1
-    }
 
-    headers = {
-        "Accept": "application/json",
-        "X-UserToken": "no-check"
-    }
+def load_lookup_cache(path=None):
+    """Read the persistent lookup cache (default: LOOKUP_CACHE_PATH); a missing or corrupt file is an empty cache"""
+    try:
+        with open(path or LOOKUP_CACHE_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_lookup_cache(cache, path=None):
+    path = path or LOOKUP_CACHE_PATH
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(cache, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def invalidate_lookup_cache(instance_url=None):
+    """Drop cached lookups for one instance, or all of them"""
+    with _lookup_cache_lock:
+        cache = load_lookup_cache()
+        if instance_url is None:
+            cache = {}
+        else:
+            prefix = f"{instance_url.rstrip('/')}|"
+            cache = {k: v for k, v in cache.items() if not k.startswith(prefix)}
+        save_lookup_cache(cache)
+
+
+def lookup_sys_ids(client, table, titles, fallback_first=False, ttl=LOOKUP_CACHE_TTL):
+    """
+    Resolve record titles to sys_ids, serving fresh entries from the local cache.
+    All cache misses are fetched with one OR query. With fallback_first, a title
+    that doesn't exist resolves to the oldest record of the table; that
+    fallback is never cached under the requested title, and neither is a miss.
+    """
+    now = time.time()
+    resolved = {}
+    missing = []
+
+    with _lookup_cache_lock:
+        cache = load_lookup_cache(client.lookup_cache_path)
+    for title in titles:
+        entry = cache.get(f"{client.instance_url}|{table}|{title}")
+        if entry and now - entry["cached_at"] < ttl:
+            resolved[title] = entry["sys_id"]
+        else:
+            missing.append(title)
+
+    if not missing:
+        return resolved
+
+    # Titles are not unique, so the limit must not be the number of titles asked for
+    params = {"sysparm_query": "^OR".join(f"title={title}" for title in missing), "sysparm_limit": LOOKUP_QUERY_LIMIT}
+    resp = client.get(f"/api/now/table/{table}", params=params, fields=("sys_id", "title"))
+    resp.raise_for_status()
 
-    resp = requests.get(
-        url,
-        params=params,
-        auth=HTTPBasicAuth(USERNAME, PASSWORD),
-        headers=headers,
-        timeout=30
-    )
+    found = {}
+    for record in resp.json()["result"]:
+        found.setdefault(record.get("title"), record["sys_id"])
+
+    with _lookup_cache_lock:
+        cache = load_lookup_cache(client.lookup_cache_path)
+        for title in missing:
+            if found.get(title):
+                cache[f"{client.instance_url}|{table}|{title}"] = {"sys_id": found[title], "cached_at": now}
+        save_lookup_cache(cache, client.lookup_cache_path)
+
+    fallback = None
+    for title in missing:
+        sys_id = found.get(title)
+        if sys_id is None and fallback_first:
+            if fallback is None:
+                params = {"sysparm_query": "ORDERBYsys_created_on", "sysparm_limit": 1}
+                resp = client.get(f"/api/now/table/{table}", params=params, fields=("sys_id", "title"))
+                resp.raise_for_status()
+                result = resp.json()["result"]
+                fallback = result[0]["sys_id"] if result else ""
+            if fallback:
+                print(f"⚠️  {table} '{title}' not found, using first available")
+            sys_id = fallback or None
+        resolved[title] = sys_id
+
+    return resolved
+
+
+def get_catalog_sys_id(client, catalog_name="Service Catalog"):
+    """Get the sys_id of a catalog, or of the first available one"""
+    sys_id = lookup_sys_ids(client, "sc_catalog", [catalog_name], fallback_first=True)[catalog_name]
+
+    if not sys_id:
+        raise RuntimeError("No catalogs found in instance")
 
-    resp.raise_for_status()
-    result = resp.json()["result"]
+    return sys_id
 
-    if not result:
-        print(f"⚠️  Catalog '{catalog_name}' not found, using first available")
-        return get_first_catalog()
-    
-    return result[0]["sys_id"]
+
+def get_category_sys_id(client, category_name):
+    """Get the sys_id of a category"""
+    sys_id = lookup_sys_ids(client, "sc_category", [category_name])[category_name]
+
+    if not sys_id:
+        print(f"⚠️  Category '{category_name}' not found, will create without category")
+
+    return sys_id
 
 
-def get_first_catalog():
-    """Get the first available catalog"""
-    url = f"{INSTANCE_URL}/api/now/table/sc_catalog"
+@timed_step()
+def create_catalog_item(client, update_set_sys_id, config=CATALOG_ITEM_CONFIG, catalog_sys_id=None,
+                        category_sys_id=None):
+    """
+    Create a catalog item. catalog_sys_id and category_sys_id skip their lookups
+    when a lookup step already resolved them ("" is a category known to be missing).
+    """
+    print("📋 Creating Service Catalog Item...")
 
-    params = {"sysparm_limit": 1}
+    if catalog_sys_id is None:
+        catalog_sys_id = get_catalog_sys_id(client)
+    if category_sys_id is None:
+        category_sys_id = get_category_sys_id(client, config["category"])
+    elif not category_sys_id:
+        print(f"⚠️  Category '{config['category']}' not found, will create without category")
 
-    headers = {
-        "Accept": "application/json",
-        "X-UserToken": "no-check"
+    payload = {
+        "name": config["name"],
+        "short_description": config["short_description"],
+        "description": config["description"],
+        "sc_catalogs": catalog_sys_id,
+        "price": config["price"],
+        "active": "true",
+        "sys_update_set": update_set_sys_id
     }
 
-    resp = requests.get(
-        url,
-        params=params,
-        auth=HTTPBasicAuth(USERNAME, PASSWORD),
-        headers=headers,
-        timeout=30
-    )
+    if category_sys_id:
+        payload["category"] = category_sys_id
 
-    resp.raise_for_status()
-    result = resp.json()["result"]
+    if config.get("workflow"):
+        payload["workflow"] = config["workflow"]
 
-    if not result:
-        raise RuntimeError("No catalogs found in instance")
-    
-    return result[0]["sys_id"]
+    # A retried create reuses an item of the same name this user created in the last few minutes
+    dedupe_query = (
+        f"name={payload['name']}^sys_created_by={client.username}"
+        "^sys_created_on>=javascript:gs.minutesAgoStart(5)"
+    )
+    try:
+        result = create_record_once(client, "sc_cat_item", payload, dedupe_query)
+    except requests.HTTPError as e:
+        print(f"Create Catalog Item - Status: {e.response.status_code}")
+        print(f"Response: {e.response.text}")
+        raise
 
+    print("✅ Catalog Item created")
+    print(f"   sys_id: {result['sys_id']}")
+    print(f"   name: {result['name']}")
 
-def get_category_sys_id(category_name):
-    """Get the sys_id of a category"""
-    url = f"{INSTANCE_URL}/api/now/table/sc_category"
+    return result["sys_id"]
 
-    params = {
-        "sysparm_query": f"title={category_name}",
-        "sysparm_limit": 1
-    }
 
-    headers = {
-        "Accept": "application/json",
-        "X-UserToken": "no-check"
+def build_variable_payload(catalog_item_sys_id, update_set_sys_id, var):
+    """Build the item_option_new record for one variable"""
+    payload = {
+        "cat_item": catalog_item_sys_id,
+        "name": var["name"],
+        "question_text": var["question_text"],
+        "type": var["type"],
+        "mandatory": var["mandatory"],
+        "order": var["order"],
+        "active": "true",
+        "sys_update_set": update_set_sys_id
     }
 
-    resp = requests.get(
-        url,
-        params=params,
-        auth=HTTPBasicAuth(USERNAME, PASSWORD),
-        headers=headers,
-        timeout=30
-    )
+    if "default_value" in var:
+        payload["default_value"] = var["default_value"]
 
-    resp.raise_for_status()
-    result = resp.json()["result"]
+    return payload
 
-    if not result:
-        print(f"⚠️  Category '{category_name}' not found, will create without category")
-        return None
-    
-    return result[0]["sys_id"]
 
+class VariableCreationError(RuntimeError):
+    """Raised after all variable requests finish, if any of them failed"""
 
-def create_catalog_item(update_set_sys_id):
-    """Create a catalog item"""
-    print("📋 Creating Service Catalog Item...")
-
-    url = f"{INSTANCE_URL}/api/now/table/sc_cat_item"
+    def __init__(self, errors, created):
+        self.errors = errors
+        self.created = created
+        names = ", ".join(name for name, _ in errors)
+        super().__init__(f"{len(errors)} catalog variable(s) could not be created: {names}")
 
-    catalog_sys_id = get_catalog_sys_id()
-    category_sys_id = get_category_sys_id(CATALOG_ITEM_CONFIG["category"])
 
+def submit_batch(client, rest_requests):
+    """Send sub-requests through the Batch API; returns {id: (status_code, body)}"""
     payload = {
-        "name": CATALOG_ITEM_CONFIG["name"],
-        "short_description": CATALOG_ITEM_CONFIG["short_description"],
-        "description": CATALOG_ITEM_CONFIG["description"],
-        "sc_catalogs": catalog_sys_id,
-        "price": CATALOG_ITEM_CONFIG["price"],
-        "active": "true",
-        "sys_update_set": update_set_sys_id
+        "batch_request_id": uuid.uuid4().hex,
+        "enforce_order": False,
+        "rest_requests": rest_requests
     }
 
-    if category_sys_id:
-        payload["category"] = category_sys_id
+    resp = client.post(BATCH_URL, json=payload)
+    resp.raise_for_status()
 
-    if CATALOG_ITEM_CONFIG.get("workflow"):
-        payload["workflow"] = CATALOG_ITEM_CONFIG["workflow"]
+    results = {}
+    for served in resp.json().get("serviced_requests", []):
+        raw = base64.b64decode(served.get("body") or "")
+        try:
+            body = json.loads(raw) if raw else {}
+        except ValueError:
+            body = {}
+        results[served["id"]] = (served.get("status_code"), body)
+
+    # Anything listed in unserviced_requests is simply absent from the result
+    return results
+
+
+def _batch_create_variables(client, url, payloads, indices):
+    """Create one chunk of variables in a single Batch API call; returns {index: sys_id}"""
+    url = client.projected_path(url, ("sys_id",), "POST")
+    rest_requests = [
+        {
+            "id": str(i),
+            "url": url,
+            "method": "POST",
+            "exclude_response_headers": True,
+            "headers": [
+                {"name": "Content-Type", "value": "application/json"},
+                {"name": "Accept", "value": "application/json"}
+            ],
+            "body": base64.b64encode(json.dumps(payloads[i]).encode("utf-8")).decode("ascii")
+        }
+        for i in indices
+    ]
+
+    results = submit_batch(client, rest_requests)
+
+    created = {}
+    for i in indices:
+        status, body = results.get(str(i), (None, None))
+        if status in (200, 201) and body.get("result", {}).get("sys_id"):
+            created[i] = body["result"]["sys_id"]
+    return created
+
+
+def create_record_once(client, table, payload, dedupe_query, fields=("sys_id", "name")):
+    """
+    POST a record that is not safe to blindly repeat. After a 5xx or a
+    connection error, dedupe_query is checked first so a record the instance
+    did create is reused instead of being created a second time.
+    Returns the record's `fields`.
+    """
+    url = f"/api/now/table/{table}"
+    attempt = 0
+    while True:
+        resp = None
+        try:
+            resp = client.post(url, json=payload, fields=fields)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt >= client.max_retries:
+                raise
+        else:
+            if resp.status_code not in DEDUPE_RETRY_STATUSES or attempt >= client.max_retries:
+                resp.raise_for_status()
+                return resp.json()["result"]
+
+        # A 503's Retry-After is honoured like the client's own retries
+        time.sleep(client.retry_delay(attempt, resp))
+        attempt += 1
+
+        params = {"sysparm_query": dedupe_query, "sysparm_limit": 1}
+        check = client.get(url, params=params, fields=fields)
+        if check.status_code == 200 and check.json().get("result"):
+            return check.json()["result"][0]
+
+
+def find_existing_variables(client, catalog_item_sys_id, names, chunk_size=100):
+    """Return {name: sys_id} for the item's variables with these names (an active row wins)"""
+    existing = {}
+    for start in range(0, len(names), chunk_size):
+        params = {
+            "sysparm_query": f"cat_item={catalog_item_sys_id}^nameIN{','.join(names[start:start + chunk_size])}",
+            "sysparm_limit": 10000
+        }
+        resp = client.get("/api/now/table/item_option_new", params=params, fields=("sys_id", "name", "active"))
+        resp.raise_for_status()
+        for record in resp.json()["result"]:
+            if record["name"] not in existing or record.get("active") == "true":
+                existing[record["name"]] = record["sys_id"]
+    return existing
+
+
+def _create_variable(client, url, payload):
+    """Create a single variable with a plain Table API POST, deduplicated by item and name"""
+    dedupe_query = f"cat_item={payload['cat_item']}^name={payload['name']}"
+    return create_record_once(client, "item_option_new", payload, dedupe_query, fields=("sys_id",))["sys_id"]
+
+
+@timed_step()
+def add_catalog_variables(client, catalog_item_sys_id, update_set_sys_id, variables,
+                          batch_size=BATCH_SIZE, max_in_flight=MAX_IN_FLIGHT):
+    """
+    Add variables to the catalog item from XML.
+    Up to max_in_flight requests (batches of batch_size, then single retries) run at once.
+    Returns sys_ids ordered by each variable's "order"; raises VariableCreationError
+    listing every failure once all requests have finished.
+    """
+    print("📝 Adding catalog variables from XML...")
 
-    headers = {
-        "Accept": "application/json",
-        "Content-Type": "application/json",
-        "X-UserToken": "no-check"
-    }
+    url = "/api/now/table/item_option_new"
+    variables = sorted(variables, key=lambda v: int(v["order"]))
+    payloads = [build_variable_payload(catalog_item_sys_id, update_set_sys_id, var) for var in variables]
+    created_vars = [None] * len(variables)
+    errors = []
+
+    with ThreadPoolExecutor(max_workers=max(1, max_in_flight)) as pool:
+        if batch_size > 1:
+            chunks = [
+                range(start, min(start + batch_size, len(payloads)))
+                for start in range(0, len(payloads), batch_size)
+            ]
+            futures = {submit_in_context(pool, _batch_create_variables, client, url, payloads, chunk): chunk for chunk in chunks}
+            for future in as_completed(futures):
+                try:
+                    created = future.result()
+                except requests.RequestException as e:
+                    print(f"   ⚠️  Batch request failed ({e}), falling back to single requests")
+                    continue
+                for i, sys_id in created.items():
+                    created_vars[i] = sys_id
+                    print(f"   ✅ Created variable: {variables[i]['question_text']}")
+
+        # A failed batch may still have been processed: adopt what exists before retrying the rest
+        pending = [i for i, sys_id in enumerate(created_vars) if not sys_id]
+        if pending and batch_size > 1:
+            try:
+                existing = find_existing_variables(client, catalog_item_sys_id,
+                                                   [variables[i]["name"] for i in pending])
+            except requests.RequestException as e:
+                # Without knowing what exists, re-posting could create duplicates
+                for i in pending:
+                    errors.append((i, variables[i]["name"], e))
+                    print(f"   ❌ Failed variable: {variables[i]['question_text']} ({e})")
+                pending = []
+            else:
+                for i in pending:
+                    if variables[i]["name"] in existing:
+                        created_vars[i] = existing[variables[i]["name"]]
+                        print(f"   ✅ Created variable: {variables[i]['question_text']}")
+                pending = [i for i in pending if not created_vars[i]]
+        if pending and batch_size > 1:
+            print(f"   🔁 Retrying {len(pending)} variable(s) individually")
+        futures = {submit_in_context(pool, _create_variable, client, url, payloads[i]): i for i in pending}
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                created_vars[i] = future.result()
+                print(f"   ✅ Created variable: {variables[i]['question_text']}")
+            except (requests.RequestException, KeyError, ValueError) as e:
+                errors.append((i, variables[i]["name"], e))
+                print(f"   ❌ Failed variable: {variables[i]['question_text']} ({e})")
+
+    if errors:
+        errors.sort(key=lambda err: err[0])
+        raise VariableCreationError([(name, e) for _, name, e in errors], created_vars)
+
+    return created_vars
 
-    resp = requests.post(
-        url,
-        json=payload,
-        auth=HTTPBasicAuth(USERNAME, PASSWORD),
-        headers=headers,
-        timeout=30
-    )
 
-    print(f"Create Catalog Item - Status: {resp.status_code}")
-    if resp.status_code not in [200, 201]:
+@timed_step()
+def import_catalog_variables(client, catalog_item_sys_id, update_set_sys_id, variables,
+                             table=IMPORT_SET_TABLE, timeout=IMPORT_TIMEOUT):
+    """
+    Load all variables with one Import Set insertMultiple upload; the staging
+    table's transform map creates the item_option_new records on the instance.
+    Polls the staging rows until every one is transformed and returns the
+    target sys_ids in variable order. Rows that failed or were ignored raise
+    VariableCreationError with the transform's comment.
+    """
+    print(f"📦 Importing {len(variables)} catalog variable(s) through {table}...")
+
+    variables = sorted(variables, key=lambda v: int(v["order"]))
+    records = [
+        {f"u_{k}": v for k, v in build_variable_payload(catalog_item_sys_id, update_set_sys_id, var).items()}
+        for var in variables
+    ]
+
+    # One request carries every row; a retried upload would stage them twice, so it isn't retried
+    resp = client.post(f"/api/now/import/{table}/insertMultiple", json={"records": records})
+    if resp.status_code >= 400:
+        print(f"Import Set upload - Status: {resp.status_code}")
         print(f"Response: {resp.text}")
+    resp.raise_for_status()
+    import_set_sys_id = resp.json()["import_set_id"]
+    print(f"   import set: {import_set_sys_id}")
+
+    # Poll only the count of unfinished rows, then read the per-row results once
+    done_states = ",".join(sorted(IMPORT_DONE_STATES))
+    pending = [len(records)]
 
+    def transformed():
+        params = {
+            "sysparm_query": f"sys_import_set={import_set_sys_id}^sys_import_stateNOT IN{done_states}",
+            "sysparm_limit": 1
+        }
+        check = client.get(f"/api/now/table/{table}", params=params, fields=("sys_id",))
+        if check.status_code != 200:
+            return False
+        pending[0] = int(check.headers.get("X-Total-Count", len(records)))
+        return pending[0] == 0
+
+    if not wait_until(transformed, f"import set {import_set_sys_id} to be transformed", timeout):
+        raise RuntimeError(f"Import set {import_set_sys_id} not transformed after {timeout}s "
+                           f"({pending[0]} row(s) pending)")
+
+    params = {"sysparm_query": f"sys_import_set={import_set_sys_id}", "sysparm_limit": len(records)}
+    resp = client.get(f"/api/now/table/{table}", params=params,
+                      fields=("u_name", "sys_import_state", "sys_import_state_comment", "sys_target_sys_id"))
     resp.raise_for_status()
-    result = resp.json()["result"]
+    rows = resp.json()["result"]
 
-    print("✅ Catalog Item created")
-    print(f"   sys_id: {result['sys_id']}")
-    print(f"   name: {result['name']}")
+    by_name = {r.get("u_name"): r for r in rows}
+    created_vars = []
+    errors = []
+    for var in variables:
+        row = by_name.get(var["name"], {})
+        if row.get("sys_import_state") in ("inserted", "updated") and row.get("sys_target_sys_id"):
+            created_vars.append(row["sys_target_sys_id"])
+        else:
+            created_vars.append(None)
+            reason = row.get("sys_import_state_comment") or row.get("sys_import_state") or "row missing"
+            errors.append((var["name"], RuntimeError(reason)))
+            print(f"   ❌ Failed variable: {var['question_text']} ({reason})")
+
+    if errors:
+        raise VariableCreationError(errors, created_vars)
+
+    print(f"✅ Imported {len(created_vars)} variable(s)")
+    return created_vars
 
-    return result["sys_id"]
+
+def count_records(client, table, query):
+    """Number of records matching query, read from X-Total-Count without fetching them"""
+    resp = client.get(f"/api/now/table/{table}", params={"sysparm_query": query, "sysparm_limit": 1},
+                      fields=("sys_id",))
+    resp.raise_for_status()
+    return int(resp.headers.get("X-Total-Count", len(resp.json()["result"])))
+
+
+def iter_records(client, table, query, fields, page_size=PAGE_SIZE):
+    """
+    Yield every record matching query, one sysparm_offset/sysparm_limit page at a time.
+    Pages are read from the last one back to the first, so deleting records that
+    were already yielded never shifts a page that is still to be read. With an
+    ascending ORDERBY the records therefore come out in descending order.
+    """
+    url = f"/api/now/table/{table}"
+    total = count_records(client, table, query)
+
+    offset = (total - 1) // page_size * page_size
+    while offset >= 0:
+        params = {"sysparm_query": query, "sysparm_offset": offset, "sysparm_limit": page_size}
+        resp = client.get(url, params=params, fields=fields)
+        resp.raise_for_status()
+        yield from reversed(resp.json()["result"])
+        offset -= page_size
 
 
-def add_catalog_variables(catalog_item_sys_id, update_set_sys_id, variables):
-    """Add variables to the catalog item from XML"""
-    print("📝 Adding catalog variables from XML...")
+@timed_step()
+def find_catalog_item(client, item_name):
+    """Return the sys_id of the newest active catalog item with this name, or None"""
+    params = {
+        "sysparm_query": f"name={item_name}^active=true^ORDERBYDESCsys_created_on",
+        "sysparm_limit": 1
+    }
 
-    url = f"{INSTANCE_URL}/api/now/table/item_option_new"
-    created_vars = []
+    resp = client.get("/api/now/table/sc_cat_item", params=params, fields=("sys_id", "name"))
+
+    resp.raise_for_status()
+    result = resp.json()["result"]
 
+    return result[0]["sys_id"] if result else None
+
+
+@timed_step()
+def fetch_item_variables(client, catalog_item_sys_id):
+    """Fetch every variable of a catalog item in a single query"""
+    params = {
+        "sysparm_query": f"cat_item={catalog_item_sys_id}^ORDERBYorder",
+        "sysparm_limit": 10000
+    }
+
+    resp = client.get("/api/now/table/item_option_new", params=params, fields=("sys_id", "active") + SYNC_FIELDS)
+
+    resp.raise_for_status()
+    return resp.json()["result"]
+
+
+def diff_variables(existing, variables):
+    """
+    Compare the item's current variables with the desired ones.
+    Returns {"create": [var], "update": [(sys_id, changes)], "deactivate": [sys_id]}.
+    """
+    current = {}
+    extras = []
+    for record in existing:
+        # Prefer an active row when the same name exists more than once
+        other = current.get(record["name"])
+        if other is None or (other.get("active") != "true" and record.get("active") == "true"):
+            if other is not None:
+                extras.append(other)
+            current[record["name"]] = record
+        else:
+            extras.append(record)
+
+    diff = {"create": [], "update": [], "deactivate": []}
     for var in variables:
-        payload = {
-            "cat_item": catalog_item_sys_id,
-            "name": var["name"],
-            "question_text": var["question_text"],
-            "type": var["type"],
-            "mandatory": var["mandatory"],
-            "order": var["order"],
-            "active": "true",
-            "sys_update_set": update_set_sys_id
+        record = current.pop(var["name"], None)
+        if record is None:
+            diff["create"].append(var)
+            continue
+
+        changes = {
+            field: var.get(field, "")
+            for field in SYNC_FIELDS
+            if str(record.get(field, "")) != str(var.get(field, ""))
         }
+        if record.get("active") != "true":
+            changes["active"] = "true"
+        if changes:
+            diff["update"].append((record["sys_id"], changes))
 
-        if "default_value" in var:
-            payload["default_value"] = var["default_value"]
+    for record in list(current.values()) + extras:
+        if record.get("active") == "true":
+            diff["deactivate"].append(record["sys_id"])
 
-        headers = {
-            "Accept": "application/json",
-            "Content-Type": "application/json",
-            "X-UserToken": "no-check"
-        }
+    return diff
 
-        resp = requests.post(
-            url,
-            json=payload,
-            auth=HTTPBasicAuth(USERNAME, PASSWORD),
-            headers=headers,
-            timeout=30
-        )
 
-        resp.raise_for_status()
-        result = resp.json()["result"]
-        created_vars.append(result["sys_id"])
-        print(f"   ✅ Created variable: {var['question_text']}")
+def _patch_variable(client, sys_id, changes):
+    resp = client.patch(f"/api/now/table/item_option_new/{sys_id}", json=changes, fields=("sys_id",))
+    resp.raise_for_status()
+    return sys_id
 
-    return created_vars
 
+@timed_step()
+def sync_catalog_variables(client, catalog_item_sys_id, update_set_sys_id, diff, max_in_flight=MAX_IN_FLIGHT):
+    """Apply a diff_variables() result: create new variables, patch changed ones, deactivate removed ones"""
+    print(f"🔄 Syncing catalog variables: {len(diff['create'])} to create, "
+          f"{len(diff['update'])} to update, {len(diff['deactivate'])} to deactivate")
 
-def attach_xml(update_set_sys_id):
-    """Attach XML file to update set for reference"""
-    print("📎 Attaching terraform_vars.xml to Update Set...")
+    patches = [(sys_id, dict(changes, sys_update_set=update_set_sys_id)) for sys_id, changes in diff["update"]]
+    patches += [(sys_id, {"active": "false", "sys_update_set": update_set_sys_id}) for sys_id in diff["deactivate"]]
 
-    url = (
-        f"{INSTANCE_URL}/api/now/attachment/file"
-        f"?table_name=sys_update_set"
-        f"&table_sys_id={update_set_sys_id}"
-        f"&file_name={os.path.basename(XML_PATH)}"
-    )
+    errors = []
+    with ThreadPoolExecutor(max_workers=max(1, max_in_flight)) as pool:
+        futures = {submit_in_context(pool, _patch_variable, client, sys_id, changes): sys_id for sys_id, changes in patches}
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except requests.RequestException as e:
+                errors.append((futures[future], e))
+                print(f"   ❌ Failed to update variable {futures[future]} ({e})")
 
-    with open(XML_PATH, "rb") as f:
-        files = {
-            "file": (os.path.basename(XML_PATH), f, "application/xml")
-        }
+    created = []
+    if diff["create"]:
+        created = add_catalog_variables(client, catalog_item_sys_id, update_set_sys_id, diff["create"],
+                                        max_in_flight=max_in_flight)
 
-        headers = {
-            "Accept": "application/json"
-        }
+    if errors:
+        raise VariableCreationError(errors, created)
+
+    print(f"✅ Variables synced ({len(patches)} updated/deactivated, {len(created)} created)")
+    return created
+
+
+def file_sha256(path):
+    """SHA-256 of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(EXPORT_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
 
-        resp = requests.post(
-            url,
-            auth=HTTPBasicAuth(USERNAME, PASSWORD),
-            files=files,
-            headers=headers,
-            timeout=60
+
+def find_attachment(client, table_sys_id, file_name, sha256):
+    """Return the sys_id of an update set attachment with this name and content hash, or None"""
+    params = {
+        "sysparm_query": f"table_name=sys_update_set^table_sys_id={table_sys_id}^file_name={file_name}",
+        "sysparm_limit": 10
+    }
+
+    resp = client.get("/api/now/attachment", params=params, fields=("sys_id", "hash"))
+
+    resp.raise_for_status()
+    for record in resp.json()["result"]:
+        if record.get("hash") == sha256:
+            return record["sys_id"]
+    return None
+
+
+@timed_step()
+def attach_xml(client, update_set_sys_id, xml_path=XML_PATH, compress=False):
+    """
+    Attach XML file to update set for reference.
+    The body is streamed from disk (optionally gzip-compressed first), and the
+    upload is skipped when an identical attachment is already on the update set.
+    """
+    print(f"📎 Attaching {os.path.basename(xml_path)} to Update Set...")
+
+    upload_path = xml_path
+    file_name = os.path.basename(xml_path)
+    content_type = "application/xml"
+
+    if compress:
+        # mtime=0 keeps the gzip bytes, and so the content hash, stable between runs
+        # Unique temp name: concurrent targets may compress the same XML at once
+        upload_path = f"{xml_path}.{uuid.uuid4().hex}.gz"
+        file_name += ".gz"
+        content_type = "application/gzip"
+        with open(xml_path, "rb") as src, open(upload_path, "wb") as raw:
+            with gzip.GzipFile(filename="", mode="wb", fileobj=raw, mtime=0) as gz:
+                shutil.copyfileobj(src, gz, EXPORT_CHUNK_SIZE)
+
+    try:
+        sha256 = file_sha256(upload_path)
+        existing = find_attachment(client, update_set_sys_id, file_name, sha256)
+        if existing:
+            print("✅ Identical attachment already present, upload skipped")
+            print(f"   attachment sys_id: {existing}")
+            return existing
+
+        url = (
+            "/api/now/attachment/file"
+            f"?table_name=sys_update_set"
+            f"&table_sys_id={update_set_sys_id}"
+            f"&file_name={file_name}"
         )
 
+        size = os.path.getsize(upload_path)
+        headers = {"Content-Type": content_type, "Content-Length": str(size)}
+        # Allow slow links time to push big files: at least ATTACH_MIN_RATE bytes/s
+        read_timeout = max(ATTACH_TIMEOUT, size / ATTACH_MIN_RATE)
+
+        # Uploads aren't idempotent, but a stored copy is detectable by its hash before re-sending
+        attempt = 0
+        with open(upload_path, "rb") as f:
+            while True:
+                f.seek(0)
+                resp = None
+                try:
+                    resp = client.post(url, data=f, headers=headers, timeout=(REQUEST_TIMEOUT, read_timeout),
+                                       fields=("sys_id",))
+                except (requests.ConnectionError, requests.Timeout):
+                    if attempt >= client.max_retries:
+                        raise
+                else:
+                    if resp.status_code not in DEDUPE_RETRY_STATUSES or attempt >= client.max_retries:
+                        break
+
+                time.sleep(client.retry_delay(attempt, resp))
+                attempt += 1
+
+                existing = find_attachment(client, update_set_sys_id, file_name, sha256)
+                if existing:
+                    print("✅ XML attached successfully")
+                    print(f"   attachment sys_id: {existing}")
+                    return existing
+    finally:
+        if compress and os.path.exists(upload_path):
+            os.remove(upload_path)
+
     resp.raise_for_status()
     result = resp.json()["result"]
 
@@ -418,73 +1274,1048 @@ def attach_xml(update_set_sys_id):
     return result["sys_id"]
 
 
-def export_update_set(update_set_sys_id, update_set_name):
-    """Export the update set as XML file"""
+def wait_until(check, description, timeout=POLL_TIMEOUT, initial_delay=0.1, max_delay=2.0):
+    """Poll check() with exponential backoff until it is truthy or the timeout passes"""
+    deadline = time.monotonic() + timeout
+    delay = initial_delay
+
+    with RECORDER.step(f"wait_until {description}"):
+        while True:
+            try:
+                if check():
+                    return True
+            except requests.RequestException:
+                pass
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                print(f"⚠️  Timed out after {timeout}s waiting for {description}, continuing")
+                return False
+
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, max_delay)
+
+
+def record_visible(client, table, sys_id):
+    """True once a record can be read back from the Table API"""
+    resp = client.get(f"/api/now/table/{table}/{sys_id}", fields=("sys_id",))
+    return resp.status_code == 200
+
+
+def update_set_preference_applied(client, update_set_sys_id):
+    """True once the sys_update_set user preference points at the update set"""
+    params = {
+        "sysparm_query": f"name=sys_update_set^value={update_set_sys_id}",
+        "sysparm_limit": 1
+    }
+    resp = client.get("/api/now/table/sys_user_preference", params=params, fields=("sys_id",))
+    return resp.status_code == 200 and bool(resp.json().get("result"))
+
+
+def attachment_stored(client, attachment_sys_id):
+    """True once the attachment's metadata is readable"""
+    resp = client.get(f"/api/now/attachment/{attachment_sys_id}", fields=("sys_id",))
+    return resp.status_code == 200
+
+
+def variables_committed(client, catalog_item_sys_id, expected):
+    """True once at least `expected` variables are visible on the catalog item"""
+    params = {
+        "sysparm_query": f"cat_item={catalog_item_sys_id}^active=true",
+        "sysparm_limit": 1
+    }
+    # X-Total-Count is still sent with the pagination (Link) header suppressed
+    resp = client.get("/api/now/table/item_option_new", params=params, fields=("sys_id",))
+    return resp.status_code == 200 and int(resp.headers.get("X-Total-Count", 0)) >= expected
+
+
+@timed_step()
+def export_update_set(client, update_set_sys_id, update_set_name, compress=False, export_dir=None):
+    """
+    Stream the update set export to disk in chunks, optionally gzip-compressed.
+    An interrupted plain export leaves a .part file that the next run resumes
+    with a Range request when the server supports it.
+    """
     print("📦 Exporting Update Set as XML...")
     
-    url = f"{INSTANCE_URL}/sys_remote_update_set.do"
+    url = "/sys_remote_update_set.do"
     
     params = {
         "XML": "",
         "sysparm_sys_id": update_set_sys_id,
         "sysparm_action": "export"
     }
-    
-    resp = requests.get(
-        url,
-        params=params,
-        auth=HTTPBasicAuth(USERNAME, PASSWORD),
-        timeout=60
-    )
-    
-    resp.raise_for_status()
-    
-    # Save exported XML
-    export_filename = f"{update_set_name}_export.xml"
-    with open(export_filename, "wb") as f:
-        f.write(resp.content)
+
+    export_filename = f"{update_set_name}_export.xml" + (".gz" if compress else "")
+    if export_dir:
+        os.makedirs(export_dir, exist_ok=True)
+        export_filename = os.path.join(export_dir, export_filename)
+    part_path = f"{export_filename}.part"
+
+    # The export is XML, not a JSON API response
+    headers = {"Accept": "*/*"}
+    digest = hashlib.sha256()
+    offset = 0
+    if not compress and os.path.isfile(part_path):
+        with open(part_path, "rb") as f:
+            for chunk in iter(lambda: f.read(EXPORT_CHUNK_SIZE), b""):
+                digest.update(chunk)
+                offset += len(chunk)
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+            print(f"   ↪️  Resuming export at byte {offset}")
+
+    with client.get(url, params=params, headers=headers, timeout=60, stream=True) as resp:
+        resp.raise_for_status()
+
+        if offset and resp.status_code != 206:
+            print("   ⚠️  Server ignored the Range request, restarting export")
+            digest = hashlib.sha256()
+            offset = 0
+
+        if compress:
+            out = gzip.open(part_path, "wb")
+        else:
+            out = open(part_path, "ab" if offset else "wb")
+
+        size = offset
+        with out:
+            for chunk in resp.iter_content(chunk_size=EXPORT_CHUNK_SIZE):
+                digest.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+
+    os.replace(part_path, export_filename)
     
     print(f"✅ Update Set exported to: {export_filename}")
+    print(f"   size: {size} bytes, sha256: {digest.hexdigest()}")
     return export_filename
 
 
-def mark_complete(update_set_sys_id):
+@timed_step()
+def mark_complete(client, update_set_sys_id):
     """Mark update set as complete"""
     print("✅ Marking Update Set as Complete...")
 
-    url = f"{INSTANCE_URL}/api/now/table/sys_update_set/{update_set_sys_id}"
+    url = f"/api/now/table/sys_update_set/{update_set_sys_id}"
 
     payload = {"state": "complete"}
 
-    headers = {
-        "Accept": "application/json",
-        "Content-Type": "application/json",
-        "X-UserToken": "no-check"
-    }
-
-    resp = requests.patch(
-        url,
-        json=payload,
-        auth=HTTPBasicAuth(USERNAME, PASSWORD),
-        headers=headers,
-        timeout=30
-    )
+    resp = client.patch(url, json=payload, fields=("sys_id",))
 
     resp.raise_for_status()
     print("✅ Update Set marked as complete")
 
 
+class DeployJournal:
+    """
+    Local record of the deploy steps that completed and the sys_ids they
+    created, rewritten after every step. With path=None it only lives in memory.
+    """
+
+    def __init__(self, path, instance_url, mode, steps=None):
+        self.path = path
+        self.instance_url = instance_url
+        self.mode = mode
+        self.steps = steps or {}
+        self.resumed = set(self.steps)
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def refuse_overwrite(path, resume=False, fresh=False):
+        """Exit instead of starting over on top of an unfinished run's journal, unless fresh discards it"""
+        if path and not resume and not fresh and os.path.exists(path):
+            print(f"❌ Deploy journal {path} holds an unfinished deploy: rerun with --resume to continue it, "
+                  f"or with --fresh to discard it and start over")
+            sys.exit(1)
+
+    @classmethod
+    def open(cls, path, instance_url, mode, resume=False, fresh=False):
+        """
+        Start a new journal, or continue the one at path when resume is set.
+        An existing journal is only replaced with fresh, so its sys_ids aren't lost by accident.
+        """
+        cls.refuse_overwrite(path, resume, fresh)
+        if resume:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                print(f"⚠️  No deploy journal at {path}, starting from the beginning")
+                data = None
+            if data is not None:
+                if data.get("instance_url") != instance_url.rstrip("/") or data.get("mode") != mode:
+                    print(f"❌ Journal {path} belongs to a {data.get('mode')} deploy on {data.get('instance_url')}")
+                    sys.exit(1)
+                print(f"↪️  Resuming deploy from {path}: {len(data['steps'])} step(s) already done")
+                return cls(path, instance_url.rstrip("/"), mode, data["steps"])
+        journal = cls(path, instance_url.rstrip("/"), mode)
+        journal.save()
+        return journal
+
+    def save(self):
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"instance_url": self.instance_url, "mode": self.mode, "steps": self.steps}, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def step(self, name, run):
+        """Return the recorded result of step `name`, or run it and record its result (None as true)"""
+        with self.lock:
+            if name in self.steps:
+                if name in self.resumed:
+                    print(f"↪️  {name}: done in a previous run, skipped")
+                return self.steps[name]
+        value = run()
+        if value is None:
+            value = True
+        with self.lock:
+            self.steps[name] = value
+            self.save()
+        return value
+
+    def clear(self):
+        """Forget the journal once the deploy has finished"""
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def add_or_resume_variables(client, catalog_item_sys_id, update_set_sys_id, variables, resumed, import_set=False):
+    """
+    Create the item's variables and return the new sys_ids, through the Import
+    Set API when import_set is set. For an item from a resumed run, only the
+    variables that are missing or differ are written, so partial work is kept.
+    """
+    if not resumed:
+        if import_set:
+            return import_catalog_variables(client, catalog_item_sys_id, update_set_sys_id, variables)
+        return add_catalog_variables(client, catalog_item_sys_id, update_set_sys_id, variables)
+    diff = diff_variables(fetch_item_variables(client, catalog_item_sys_id), variables)
+    print(f"↪️  Resuming variables: {len(diff['create'])} to create, {len(diff['update'])} to update")
+    return sync_catalog_variables(client, catalog_item_sys_id, update_set_sys_id, diff)
+
+
+# (graph, step name, thread id) of the step running in this context; pools submitted to
+# with submit_in_context() inherit it, so the offline plan can tell which step sent a request
+_current_step = contextvars.ContextVar("current_step", default=None)
+
+
+class StepGraph:
+    """
+    Small dependency graph of deploy steps. Each step starts as soon as the
+    steps it depends on have finished, independent steps run concurrently,
+    and the timings give a critical-path report afterwards.
+    """
+
+    def __init__(self, max_workers=STEP_WORKERS):
+        self.max_workers = max_workers
+        self.nodes = {}
+        self.timings = {}
+
+    def add(self, name, func, deps=()):
+        """Register func(results) to run once every step in deps has a result"""
+        missing = [d for d in deps if d not in self.nodes]
+        if missing:
+            raise ValueError(f"Step '{name}' depends on unknown step(s): {', '.join(missing)}")
+        self.nodes[name] = (func, tuple(deps))
+
+    def _run_node(self, name, func, results):
+        _current_step.set((self, name, threading.get_ident()))
+        start = time.perf_counter()
+        try:
+            return func(results)
+        finally:
+            self.timings[name] = (start - self.started, time.perf_counter() - self.started)
+
+    def run(self):
+        """Run every step; the first failure stops new steps from starting and is re-raised"""
+        results = {}
+        pending = dict(self.nodes)
+        running = {}
+        error = None
+        self.started = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=max(1, self.max_workers)) as pool:
+            while pending or running:
+                if error is None:
+                    for name, (func, deps) in list(pending.items()):
+                        if all(d in results for d in deps):
+                            del pending[name]
+                            running[submit_in_context(pool, self._run_node, name, func, results)] = name
+                if not running:
+                    break
+                done, _ = wait_futures(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        results[name] = future.result()
+                    except BaseException as e:
+                        error = error or e
+
+        if error is not None:
+            raise error
+        return results
+
+    def critical_path(self):
+        """The chain of steps that determined the total time, as [(name, start, end)]"""
+        if not self.timings:
+            return []
+        name = max(self.timings, key=lambda n: self.timings[n][1])
+        path = []
+        while name is not None:
+            start, end = self.timings[name]
+            path.append((name, start, end))
+            deps = [d for d in self.nodes[name][1] if d in self.timings]
+            name = max(deps, key=lambda d: self.timings[d][1]) if deps else None
+        return list(reversed(path))
+
+    def longest_chain(self, weights):
+        """Largest sum of weights[name] along any chain of dependent steps, e.g. their round trips"""
+        totals = {}
+
+        def total(name):
+            if name not in totals:
+                deps = self.nodes[name][1]
+                totals[name] = weights.get(name, 0) + max((total(d) for d in deps), default=0)
+            return totals[name]
+
+        return max((total(name) for name in self.nodes), default=0)
+
+    def print_report(self):
+        path = self.critical_path()
+        if not path:
+            return
+        total = path[-1][2]
+        busy = sum(end - start for start, end in self.timings.values())
+        print(f"\n🧭 CRITICAL PATH ({total:.3f}s wall, {busy:.3f}s of step time, {busy / total if total else 0:.1f}x overlap)")
+        for name, start, end in path:
+            print(f"   {start:8.3f}s → {end:8.3f}s  {end - start:7.3f}s  {name}")
+
+
+def add_lookup_steps(graph, client, categories):
+    """Add steps resolving the catalog and categories once; their results are passed to create_catalog_item"""
+    graph.add("catalog_lookup", lambda r: get_catalog_sys_id(client))
+    graph.add("category_lookup", lambda r: lookup_sys_ids(client, "sc_category", sorted(set(categories))))
+
+
+@timed_step()
+def deploy(client, variables, xml_path=XML_PATH, poll_timeout=POLL_TIMEOUT, sync=False,
+           attach_gzip=False, export_gzip=False, xml_pending=None, export_dir=None, journal=None,
+           import_set=False):
+    """
+    Run the whole update set pipeline against one instance.
+    Steps run as a dependency graph: the lookups, the attachment and the
+    current update set preference all proceed concurrently once their inputs exist.
+    xml_pending is a future still writing xml_path; it is only waited on right before the upload.
+    The export is written to export_dir (default: the working directory).
+    Each finished step is checkpointed in journal, and steps it already holds are skipped.
+    With import_set, new variables are loaded through the Import Set API in one upload.
+    Returns the created sys_ids and export file name, or None when sync finds nothing to change.
+    """
+    journal = journal or DeployJournal(None, client.instance_url, "single")
+    catalog_item_sys_id = None
+    diff = None
+    if sync:
+        catalog_item_sys_id = find_catalog_item(client, CATALOG_ITEM_CONFIG["name"])
+        if catalog_item_sys_id:
+            diff = diff_variables(fetch_item_variables(client, catalog_item_sys_id), variables)
+            # A resumed run still has to finish (complete and export) its update set
+            if not any(diff.values()) and not journal.steps:
+                print(f"✅ Catalog item '{CATALOG_ITEM_CONFIG['name']}' is already up to date, nothing to deploy")
+                return None
+        else:
+            print(f"ℹ️  Catalog item '{CATALOG_ITEM_CONFIG['name']}' not found, creating it")
+
+    graph = StepGraph()
+
+    # Create update set
+    graph.add("update_set", lambda r: journal.step("update_set", lambda: create_update_set(client)))
+    graph.add("update_set_visible", lambda r: wait_until(
+        lambda: record_visible(client, "sys_update_set", r["update_set"][0]),
+        "update set to become visible", poll_timeout
+    ), ["update_set"])
+
+    # Set as current update set
+    graph.add("current_update_set", lambda r: journal.step(
+        "current_update_set", lambda: set_current_update_set(client, r["update_set"][0])
+    ), ["update_set_visible"])
+    graph.add("preference_applied", lambda r: wait_until(
+        lambda: update_set_preference_applied(client, r["update_set"][0]),
+        "current update set preference", poll_timeout
+    ), ["current_update_set"])
+
+    # Attach XML to update set
+    def attach(r):
+        if xml_pending is not None:
+            xml_pending.result()
+        return journal.step("attachment", lambda: attach_xml(client, r["update_set"][0], xml_path,
+                                                             compress=attach_gzip))
+
+    graph.add("attachment", attach, ["update_set_visible"])
+    graph.add("attachment_stored", lambda r: wait_until(
+        lambda: attachment_stored(client, r["attachment"]),
+        "attachment to be stored", poll_timeout
+    ), ["attachment"])
+
+    if diff is None:
+        # Create catalog item (its catalog/category lookups don't need the update set)
+        add_lookup_steps(graph, client, [CATALOG_ITEM_CONFIG["category"]])
+        graph.add("catalog_item", lambda r: journal.step(
+            "catalog_item", lambda: create_catalog_item(
+                client, r["update_set"][0], catalog_sys_id=r["catalog_lookup"],
+                category_sys_id=r["category_lookup"].get(CATALOG_ITEM_CONFIG["category"]) or ""
+            )
+        ), ["preference_applied", "catalog_lookup", "category_lookup"])
+
+        # Add variables from XML to catalog item
+        graph.add("variables", lambda r: journal.step("variables", lambda: add_or_resume_variables(
+            client, r["catalog_item"], r["update_set"][0], variables, "catalog_item" in journal.resumed,
+            import_set
+        )), ["catalog_item"])
+    else:
+        # Bring the existing item's variables in line with the XML
+        graph.add("catalog_item", lambda r: catalog_item_sys_id)
+        graph.add("variables", lambda r: journal.step("variables", lambda: sync_catalog_variables(
+            client, catalog_item_sys_id, r["update_set"][0], diff
+        )), ["preference_applied"])
+
+    graph.add("variables_committed", lambda r: wait_until(
+        lambda: variables_committed(client, r["catalog_item"], len(variables)),
+        "catalog variables to be committed", poll_timeout
+    ), ["catalog_item", "variables"])
+
+    # Mark update set as complete
+    graph.add("complete", lambda r: journal.step(
+        "complete", lambda: mark_complete(client, r["update_set"][0])
+    ), ["variables_committed", "attachment_stored"])
+
+    # Export update set as XML
+    graph.add("export", lambda r: journal.step("export", lambda: export_update_set(
+        client, r["update_set"][0], r["update_set"][1], compress=export_gzip, export_dir=export_dir
+    )), ["complete"])
+
+    results = graph.run()
+    graph.print_report()
+
+    return {
+        "update_set_sys_id": results["update_set"][0],
+        "update_set_name": results["update_set"][1],
+        "catalog_item_sys_id": results["catalog_item"],
+        "export_filename": results["export"]
+    }
+
+
+_output_prefix = contextvars.ContextVar("output_prefix", default=None)
+
+
+def submit_in_context(pool, func, *args):
+    """pool.submit() that runs func in a copy of the caller's context, so its output keeps the caller's prefix"""
+    return pool.submit(contextvars.copy_context().run, func, *args)
+
+
+class PrefixedStdout:
+    """
+    sys.stdout wrapper for concurrent targets: whole lines written in a context
+    that set a prefix are tagged with it, so interleaved output stays readable.
+    The prefix is a context variable, so pools that submit with
+    submit_in_context() (deploy steps, variable requests) inherit it.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    def set_prefix(self, prefix):
+        _output_prefix.set(prefix)
+        self.local.buffer = ""
+
+    def write(self, text):
+        prefix = _output_prefix.get()
+        if prefix is None:
+            with self.lock:
+                return self.stream.write(text)
+        *lines, self.local.buffer = (getattr(self.local, "buffer", "") + text).split("\n")
+        if lines:
+            with self.lock:
+                self.stream.write("".join(f"{prefix}{line}\n" for line in lines))
+        return len(text)
+
+    def finish(self):
+        """Emit a trailing partial line and stop prefixing this context's output"""
+        if _output_prefix.get() is not None and getattr(self.local, "buffer", ""):
+            self.write("\n")
+        _output_prefix.set(None)
+
+    def flush(self):
+        with self.lock:
+            self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+@contextmanager
+def prefixed_output():
+    """Route sys.stdout through a PrefixedStdout for the duration of the block"""
+    if isinstance(sys.stdout, PrefixedStdout):
+        yield sys.stdout
+        return
+    previous = sys.stdout
+    sys.stdout = PrefixedStdout(previous)
+    try:
+        yield sys.stdout
+    finally:
+        sys.stdout = previous
+
+
+@timed_step()
+def deploy_bulk(client, items, poll_timeout=POLL_TIMEOUT, attach_gzip=False, export_gzip=False,
+                export_dir=None, max_items_in_flight=MAX_ITEMS_IN_FLIGHT, journal=None, import_set=False):
+    """
+    Publish many catalog items into one update set and export it once.
+    Items are built concurrently (attachment, item, variables); the update set
+    is only completed and exported when every item succeeded. Steps are
+    checkpointed per item in journal, so a resumed run only redoes failed items.
+    """
+    journal = journal or DeployJournal(None, client.instance_url, "bulk")
+
+    def publish(item, update_set_sys_id, lookups, stdout):
+        name = item["config"]["name"]
+        stdout.set_prefix(f"[{name}] ")
+        try:
+            item["xml_pending"].result()
+            journal.step(f"{name}: attachment",
+                         lambda: attach_xml(client, update_set_sys_id, item["xml_path"], compress=attach_gzip))
+            catalog_item_sys_id = journal.step(f"{name}: catalog_item", lambda: create_catalog_item(
+                client, update_set_sys_id, item["config"], catalog_sys_id=lookups["catalog_lookup"],
+                category_sys_id=lookups["category_lookup"].get(item["config"]["category"]) or ""
+            ))
+            journal.step(f"{name}: variables", lambda: add_or_resume_variables(
+                client, catalog_item_sys_id, update_set_sys_id, item["variables"],
+                f"{name}: catalog_item" in journal.resumed, import_set
+            ))
+            wait_until(lambda: variables_committed(client, catalog_item_sys_id, len(item["variables"])),
+                       f"variables of '{item['config']['name']}' to be committed", poll_timeout)
+            return catalog_item_sys_id
+        finally:
+            stdout.finish()
+
+    def publish_all(r):
+        update_set_sys_id, update_set_name = r["update_set"]
+        catalog_items = {}
+        failures = []
+        with prefixed_output() as stdout, \
+                ThreadPoolExecutor(max_workers=max(1, min(max_items_in_flight, len(items)))) as pool:
+            futures = {pool.submit(publish, item, update_set_sys_id, r, stdout): item["config"]["name"]
+                       for item in items}
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    catalog_items[name] = future.result()
+                except Exception as e:  # keep building the other items, then report every failure
+                    failures.append((name, e))
+
+        if failures:
+            for name, error in failures:
+                print(f"❌ {name}: {type(error).__name__}: {error}")
+            raise RuntimeError(
+                f"{len(failures)} of {len(items)} catalog item(s) failed; update set {update_set_name} "
+                "left in progress and not exported"
+            )
+        return {item["config"]["name"]: catalog_items[item["config"]["name"]] for item in items}
+
+    graph = StepGraph()
+    graph.add("update_set", lambda r: journal.step("update_set", lambda: create_update_set(client)))
+    graph.add("update_set_visible", lambda r: wait_until(
+        lambda: record_visible(client, "sys_update_set", r["update_set"][0]),
+        "update set to become visible", poll_timeout
+    ), ["update_set"])
+    graph.add("current_update_set", lambda r: journal.step(
+        "current_update_set", lambda: set_current_update_set(client, r["update_set"][0])
+    ), ["update_set_visible"])
+    graph.add("preference_applied", lambda r: wait_until(
+        lambda: update_set_preference_applied(client, r["update_set"][0]),
+        "current update set preference", poll_timeout
+    ), ["current_update_set"])
+
+    # Resolve the catalog and every category while the update set is being set up
+    add_lookup_steps(graph, client, [item["config"]["category"] for item in items])
+    graph.add("items", publish_all, ["preference_applied", "catalog_lookup", "category_lookup"])
+
+    graph.add("complete", lambda r: journal.step(
+        "complete", lambda: mark_complete(client, r["update_set"][0])
+    ), ["items"])
+    graph.add("export", lambda r: journal.step("export", lambda: export_update_set(
+        client, r["update_set"][0], r["update_set"][1], compress=export_gzip, export_dir=export_dir
+    )), ["complete"])
+
+    results = graph.run()
+    graph.print_report()
+
+    return {
+        "update_set_sys_id": results["update_set"][0],
+        "update_set_name": results["update_set"][1],
+        "catalog_items": results["items"],
+        "export_filename": results["export"]
+    }
+
+
+def print_bulk_summary(instance_url, result, items):
+    """Print the success banner for a bulk (manifest) deploy"""
+    print("\n" + "=" * 60)
+    print("🎉 CATALOG ITEMS CREATED & UPDATE SET EXPORTED!")
+    print("=" * 60)
+    print(f"✅ Update Set: {result['update_set_name']}")
+    print(f"✅ Catalog items: {len(items)}, variables: {sum(len(item['variables']) for item in items)}")
+    print(f"✅ Exported XML: {result['export_filename']}")
+    print(f"\n🔗 View Update Set:")
+    print(f"   {instance_url}/nav_to.do?uri=sys_update_set.do?sys_id={result['update_set_sys_id']}")
+    print(f"\n📋 Catalog Items:")
+    for name, sys_id in result["catalog_items"].items():
+        print(f"   {name}: {instance_url}/nav_to.do?uri=sc_cat_item.do?sys_id={sys_id}")
+    print("=" * 60)
+
+
+def print_summary(instance_url, result, variables):
+    """Print the success banner and links for a finished deploy"""
+    print("\n" + "=" * 60)
+    print("🎉 CATALOG CREATED & UPDATE SET EXPORTED!")
+    print("=" * 60)
+    print(f"✅ Update Set: {result['update_set_name']}")
+    print(f"✅ Variables from XML: {len(variables)}")
+    print(f"✅ Exported XML: {result['export_filename']}")
+    print(f"\n🔗 View Update Set:")
+    print(f"   {instance_url}/nav_to.do?uri=sys_update_set.do?sys_id={result['update_set_sys_id']}")
+    print(f"\n📋 View Catalog Item:")
+    print(f"   {instance_url}/nav_to.do?uri=sc_cat_item.do?sys_id={result['catalog_item_sys_id']}")
+    print(f"\n🛒 Service Catalog Items List:")
+    print(f"   {instance_url}/sc_cat_item_list.do")
+    print(f"\n📦 Export XML file saved locally: {result['export_filename']}")
+    print("=" * 60)
+
+
+def load_targets(path):
+    """
+    Read a JSON list of deploy targets:
+    [{"name": "dev", "instance_url": "...", "username": "...", "password_env": "DEV_PASSWORD"}, ...]
+    "password" may be given inline instead of "password_env".
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            targets = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"❌ Cannot read targets file {path}: {e}")
+        sys.exit(1)
+
+    if not isinstance(targets, list) or not targets:
+        print(f"❌ Targets file {path} must contain a non-empty JSON list")
+        sys.exit(1)
+
+    names = set()
+    for i, target in enumerate(targets, 1):
+        if not isinstance(target, dict) or not target.get("instance_url"):
+            print(f"❌ Target #{i} in {path} has no instance_url")
+            sys.exit(1)
+        target.setdefault("name", target["instance_url"].split("//")[-1].split(".")[0])
+        target.setdefault("username", USERNAME)
+        if "password" not in target:
+            env_name = target.get("password_env")
+            if env_name and env_name not in os.environ:
+                print(f"❌ Target '{target['name']}': environment variable {env_name} is not set")
+                sys.exit(1)
+            target["password"] = os.environ[env_name] if env_name else PASSWORD
+        if target["name"] in names:
+            print(f"❌ Duplicate target name '{target['name']}' in {path}")
+            sys.exit(1)
+        names.add(target["name"])
+    return targets
+
+
+def journal_path(target_name=None):
+    """Journal file for the single-instance deploy, or for one --targets entry"""
+    if target_name is None:
+        return JOURNAL_PATH
+    root, ext = os.path.splitext(JOURNAL_PATH)
+    return f"{root}.{target_name}{ext}"
+
+
+def deploy_targets(targets, variables, max_workers=MAX_TARGETS_IN_FLIGHT, resume=False, fresh=False,
+                   **deploy_options):
+    """
+    Run deploy() against every target concurrently, each with its own client,
+    journal and export directory. The parsed variables are shared by all targets.
+    Returns {name: {"result": ..., "error": ...}} in target order.
+    """
+    width = max(len(t["name"]) for t in targets)
+
+    def run(target):
+        stdout.set_prefix(f"[{target['name']:<{width}}] ")
+        try:
+            journal = DeployJournal.open(journal_path(target["name"]), target["instance_url"], "single", resume, fresh)
+            with ServiceNowClient(target["instance_url"], target["username"], target["password"]) as client:
+                result = deploy(client, variables, export_dir=os.path.join(EXPORT_ROOT, target["name"]),
+                                journal=journal, **deploy_options)
+            journal.clear()
+            return result
+        finally:
+            stdout.finish()
+
+    outcomes = {}
+    with prefixed_output() as stdout, \
+            ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(targets)))) as pool:
+        futures = {pool.submit(run, target): target["name"] for target in targets}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                outcomes[name] = {"result": future.result(), "error": None}
+            except Exception as e:  # one failing instance must not hide the others' results
+                outcomes[name] = {"result": None, "error": e}
+    return {t["name"]: outcomes[t["name"]] for t in targets}
+
+
+def print_targets_report(targets, outcomes):
+    """Print one line per target; returns the number of failed targets"""
+    print("\n" + "=" * 60)
+    print("🌍 MULTI-TARGET DEPLOY")
+    print("=" * 60)
+    failed = 0
+    for target in targets:
+        outcome = outcomes[target["name"]]
+        if outcome["error"] is not None:
+            failed += 1
+            print(f"❌ {target['name']}: {type(outcome['error']).__name__}: {outcome['error']}")
+            print(f"   progress kept in {journal_path(target['name'])}, rerun with --resume to continue")
+        elif outcome["result"] is None:
+            print(f"✅ {target['name']}: already up to date")
+        else:
+            result = outcome["result"]
+            print(f"✅ {target['name']}: {result['update_set_name']} -> {result['export_filename']}")
+            print(f"   {target['instance_url']}/nav_to.do?uri=sys_update_set.do?sys_id={result['update_set_sys_id']}")
+    print(f"\n{len(targets) - failed}/{len(targets)} target(s) deployed")
+    print("=" * 60)
+    return failed
+
+
+# =========================================================
+# 🗺️  OFFLINE PLAN
+# =========================================================
+
+class OfflineAdapter(BaseAdapter):
+    """
+    requests transport that answers from an in-process mock_servicenow instance
+    instead of the network. Every request is kept in order with its sizes, and
+    counted against the deploy step (StepGraph node) that sent it.
+    """
+
+    def __init__(self, mock):
+        super().__init__()
+        self.mock = mock
+        self.operations = []
+        # graph -> {step name: [requests sent by the step itself, requests sent from its worker pool]}
+        self.step_requests = {}
+        self.lock = threading.Lock()
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        body = request.body or b""
+        if hasattr(body, "read"):
+            body = body.read()
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        url = urlsplit(request.url)
+        raw_path = f"{url.path}?{url.query}" if url.query else url.path
+
+        status, headers, data = self.mock.handle(request.method, raw_path, dict(request.headers), body)
+        step = _current_step.get()
+        with self.lock:
+            self.operations.append({
+                "method": request.method,
+                "endpoint": endpoint_name(url.path),
+                "status": status,
+                "bytes_out": len(body),
+                "bytes_in": len(data)
+            })
+            if step is not None:
+                graph, name, thread_id = step
+                counts = self.step_requests.setdefault(graph, {}).setdefault(name, [0, 0])
+                counts[thread_id != threading.get_ident()] += 1
+
+        resp = requests.Response()
+        resp.status_code = status
+        resp.headers = CaseInsensitiveDict(headers)
+        resp.headers["Content-Length"] = str(len(data))
+        resp.encoding = "utf-8"
+        resp.url = request.url
+        resp.request = request
+        resp.reason = "OK" if status < 400 else "Error"
+        # The whole body is already here, streamed or not
+        resp._content = data
+        resp._content_consumed = True
+        return resp
+
+    def round_trips(self, max_in_flight=MAX_IN_FLIGHT):
+        """
+        Sequential round trips of the recorded requests: those sent outside a
+        step graph one after another, plus each graph's longest chain of steps.
+        A step's own requests are sequential; the ones it fans out to a worker
+        pool cost one round trip per max_in_flight.
+        """
+        total = len(self.operations)
+        for graph, steps in self.step_requests.items():
+            total -= sum(own + pooled for own, pooled in steps.values())
+            total += graph.longest_chain({
+                name: own + -(-pooled // max(1, max_in_flight)) for name, (own, pooled) in steps.items()
+            })
+        return total
+
+    def close(self):
+        pass
+
+
+@timed_step()
+def save_snapshot(client, path):
+    """Write the instance state a plan depends on: catalog/category sys_ids and the item's variables"""
+    catalog = get_catalog_sys_id(client)
+    category = CATALOG_ITEM_CONFIG["category"]
+    catalog_item_sys_id = find_catalog_item(client, CATALOG_ITEM_CONFIG["name"])
+    snapshot = {
+        "instance_url": client.instance_url,
+        "saved_at": datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
+        "sc_catalog": {"Service Catalog": catalog},
+        "sc_category": lookup_sys_ids(client, "sc_category", [category]),
+        "catalog_item": catalog_item_sys_id,
+        "variables": fetch_item_variables(client, catalog_item_sys_id) if catalog_item_sys_id else []
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(snapshot, f, indent=2)
+    print(f"📸 Snapshot of {client.instance_url} written to {path} "
+          f"({len(snapshot['variables'])} variable(s) on the catalog item)")
+    return snapshot
+
+
+def load_snapshot(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"❌ Cannot read snapshot {path}: {e}")
+        sys.exit(1)
+
+
+def seed_offline_instance(snapshot):
+    """An in-memory instance holding the snapshot's records (or just a default catalog and category)"""
+    # Only needed for --plan, so a plain deploy never imports the mock
+    from mock_servicenow import MockServiceNow
+
+    # Without a transform delay, import sets are transformed before insertMultiple returns
+    mock = MockServiceNow(transform_delay=0)
+    if not snapshot:
+        return mock
+    for table in ("sc_catalog", "sc_category"):
+        mock.tables[table] = {}
+        for title, sys_id in snapshot.get(table, {}).items():
+            if sys_id:
+                mock.insert(table, {"sys_id": sys_id, "title": title})
+    if snapshot.get("catalog_item"):
+        mock.insert("sc_cat_item", {"sys_id": snapshot["catalog_item"], "name": CATALOG_ITEM_CONFIG["name"],
+                                    "active": "true"})
+        for variable in snapshot.get("variables", []):
+            mock.insert("item_option_new", dict(variable, cat_item=snapshot["catalog_item"]))
+    return mock
+
+
+def plan_deploy(variables, xml_path=XML_PATH, snapshot=None, rtt=PLAN_RTT, **deploy_options):
+    """
+    Run deploy() against an offline instance seeded from snapshot and return
+    the ordered HTTP operations it sent, their sizes and the number of
+    sequential round trips. Nothing leaves the machine: the lookup cache,
+    journal and export all go to a temporary directory.
+    Polls are satisfied on their first check, so they are counted once each.
+    """
+    adapter = OfflineAdapter(seed_offline_instance(snapshot))
+    diff = None
+    if snapshot and snapshot.get("catalog_item") and deploy_options.get("sync"):
+        diff = diff_variables(snapshot.get("variables", []), variables)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # Cached lookups are skipped just like a live run, but the offline sys_ids are not cached
+        cache_path = os.path.join(workdir, "lookup_cache.json")
+        if os.path.isfile(LOOKUP_CACHE_PATH):
+            shutil.copyfile(LOOKUP_CACHE_PATH, cache_path)
+        client = ServiceNowClient(INSTANCE_URL, USERNAME, "", rate_limit=0, lookup_cache_path=cache_path)
+        client.session.mount("https://", adapter)
+        client.session.mount("http://", adapter)
+        try:
+            with client, redirect_stdout(io.StringIO()):
+                result = deploy(client, variables, xml_path=xml_path, export_dir=workdir, **deploy_options)
+        finally:
+            # The offline calls are not part of this run's metrics
+            RECORDER.drain()
+
+    operations = adapter.operations
+    return {
+        "instance_url": INSTANCE_URL,
+        "variables": len(variables),
+        "up_to_date": result is None,
+        "diff": diff,
+        "operations": operations,
+        "requests": len(operations),
+        "bytes_out": sum(op["bytes_out"] for op in operations),
+        "bytes_in": sum(op["bytes_in"] for op in operations),
+        "round_trips": adapter.round_trips(),
+        "rtt": rtt
+    }
+
+
+def print_plan(plan):
+    """Print the plan's operations (consecutive identical calls folded together) and its totals"""
+    print("\n" + "=" * 60)
+    print(f"🗺️  DEPLOY PLAN for {plan['instance_url']} (offline, nothing was sent)")
+    print("=" * 60)
+
+    if plan["diff"] is not None:
+        diff = plan["diff"]
+        print(f"🔄 Against the snapshot: {len(diff['create'])} variable(s) to create, "
+              f"{len(diff['update'])} to update, {len(diff['deactivate'])} to deactivate")
+        for var in diff["create"]:
+            print(f"   + {var['name']}")
+        for sys_id, changes in diff["update"]:
+            print(f"   ~ {sys_id}: {', '.join(sorted(changes))}")
+        for sys_id in diff["deactivate"]:
+            print(f"   - {sys_id}")
+    if plan["up_to_date"]:
+        print("✅ Catalog item is already up to date, the deploy would stop after the check")
+
+    rows = []
+    for op in plan["operations"]:
+        call = f"{op['method']} {op['endpoint']}"
+        if rows and rows[-1]["call"] == call:
+            row = rows[-1]
+        else:
+            row = {"call": call, "count": 0, "bytes_out": 0, "bytes_in": 0}
+            rows.append(row)
+        row["count"] += 1
+        row["bytes_out"] += op["bytes_out"]
+        row["bytes_in"] += op["bytes_in"]
+
+    width = min(max([len(row["call"]) for row in rows] + [10]), 60)
+    print(f"{'#':>3} {'call':<{width}} {'count':>6} {'sent':>10} {'recv':>10}")
+    for i, row in enumerate(rows, 1):
+        print(f"{i:>3} {row['call'][:width]:<{width}} {row['count']:>6} {row['bytes_out']:>10} {row['bytes_in']:>10}")
+
+    print("-" * 60)
+    print(f"📨 {plan['requests']} request(s), {plan['bytes_out']} bytes sent, {plan['bytes_in']} bytes received "
+          f"(bodies; export size is the mock's)")
+    print(f"⏱️  ~{plan['round_trips']} sequential round trip(s) with the current settings, "
+          f"~{plan['round_trips'] * plan['rtt']:.1f}s at {plan['rtt'] * 1000:.0f} ms per round trip")
+    print("=" * 60)
+
+
 def main():
     """Main execution flow"""
+    parser = argparse.ArgumentParser(description="Create a ServiceNow catalog item from terraform_vars.xml")
+    parser.add_argument("--poll-timeout", type=float, default=POLL_TIMEOUT,
+                        help=f"seconds to wait for each step to become visible (default: {POLL_TIMEOUT})")
+    parser.add_argument("--sync", action="store_true",
+                        help="update the existing catalog item in place instead of creating a new one")
+    parser.add_argument("--export-gzip", action="store_true",
+                        help="gzip the exported update set while it downloads (*_export.xml.gz)")
+    parser.add_argument("--attach-gzip", action="store_true",
+                        help="gzip terraform_vars.xml before attaching it to the update set")
+    parser.add_argument("--refresh-lookups", action="store_true",
+                        help="ignore cached catalog/category sys_ids for this instance")
+    parser.add_argument("--from-tf", nargs="+", metavar="PATH",
+                        help="extract variables from these .tf files/directories in-process instead of "
+                             "reading terraform_vars.xml (the XML is still written for the attachment)")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="parallel parser processes for --from-tf (default: CPU count)")
+    parser.add_argument("--select", action="append", default=[], metavar="[NAME=]SELECTOR",
+                        help="with --from-tf, also turn the values at a block path into variables, "
+                             "e.g. resource.azurerm_windows_virtual_machine.*.size (repeatable)")
+    parser.add_argument("--targets", metavar="JSON",
+                        help="deploy to every instance listed in this JSON file concurrently")
+    parser.add_argument("--max-targets", type=int, default=MAX_TARGETS_IN_FLIGHT,
+                        help=f"targets deployed at the same time (default: {MAX_TARGETS_IN_FLIGHT})")
+    parser.add_argument("--manifest", metavar="JSON",
+                        help="publish every stack listed in this manifest as its own catalog item, "
+                             "all in one update set with a single export")
+    parser.add_argument("--import-set", action="store_true",
+                        help=f"load new variables with one Import Set upload into {IMPORT_SET_TABLE} "
+                             "(needs a transform map to item_option_new on the instance)")
+    parser.add_argument("--resume", action="store_true",
+                        help=f"continue the deploy recorded in the journal ({JOURNAL_PATH}) instead of starting over")
+    parser.add_argument("--fresh", action="store_true",
+                        help="discard the journal of an unfinished deploy and start over")
+    parser.add_argument("--max-items", type=int, default=MAX_ITEMS_IN_FLIGHT,
+                        help=f"catalog items built at the same time with --manifest (default: {MAX_ITEMS_IN_FLIGHT})")
+    parser.add_argument("--plan", action="store_true",
+                        help="list the requests and bytes a deploy would send, without contacting the instance")
+    parser.add_argument("--snapshot", metavar="JSON",
+                        help="instance state for --plan (with --sync the plan shows the variable diff)")
+    parser.add_argument("--save-snapshot", metavar="JSON",
+                        help="read the catalog item and lookups from the instance into a --plan snapshot and exit")
+    parser.add_argument("--plan-json", metavar="PATH", help="also write the --plan operations and totals as JSON")
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    if args.manifest and (args.from_tf or args.targets or args.sync):
+        parser.error("--manifest cannot be combined with --from-tf, --targets or --sync")
+    if args.plan and (args.manifest or args.targets or args.resume or args.fresh):
+        parser.error("--plan cannot be combined with --manifest, --targets, --resume or --fresh")
+    if args.resume and args.fresh:
+        parser.error("--resume and --fresh cannot be combined")
+    selectors = [parse_selector(spec) for spec in args.select]
+    if selectors and not args.from_tf:
+        parser.error("--select needs --from-tf")
+    if any(not selector for _, selector in selectors):
+        parser.error("--select needs a selector, e.g. resource.azurerm_windows_virtual_machine.*.size")
+
+    targets = load_targets(args.targets) if args.targets else None
+
+    if args.refresh_lookups:
+        for instance_url in ([t["instance_url"] for t in targets] if targets else [INSTANCE_URL]):
+            invalidate_lookup_cache(instance_url)
+
+    if args.save_snapshot:
+        print(f"🔗 Connecting to {INSTANCE_URL} as {USERNAME}...")
+        with ServiceNowClient(INSTANCE_URL, USERNAME, PASSWORD) as client:
+            save_snapshot(client, args.save_snapshot)
+        return
+
     print("=" * 60)
     print("🚀 TERRAFORM CATALOG CREATOR WITH XML EXPORT")
     print("=" * 60)
 
-    # Validate XML
-    validate_xml(XML_PATH)
-    
-    # Parse variables from XML
-    variables = parse_xml_variables()
+    if args.manifest:
+        items = extract_manifest_items(load_manifest(args.manifest), args.jobs)
+        print(f"\n🔗 Connecting to {INSTANCE_URL} as {USERNAME}...\n")
+        journal = DeployJournal.open(journal_path(), INSTANCE_URL, "bulk", args.resume, args.fresh)
+        try:
+            with ServiceNowClient(INSTANCE_URL, USERNAME, PASSWORD) as client:
+                result = deploy_bulk(client, items, args.poll_timeout, args.attach_gzip, args.export_gzip,
+                                     max_items_in_flight=args.max_items, journal=journal,
+                                     import_set=args.import_set)
+        except BaseException:
+            print(f"\n💾 Progress kept in {journal.path}, rerun with --resume to continue")
+            raise
+        finally:
+            RECORDER.print_summary()
+            RECORDER.write(args.metrics_jsonl, args.metrics_openmetrics)
+        journal.clear()
+        print_bulk_summary(INSTANCE_URL, result, items)
+        return
+
+    xml_pending = None
+    if args.from_tf:
+        # Extract straight into memory; the XML artifact is written while the network work starts
+        variables, xml_pending = extract_variables(args.from_tf, args.jobs, selectors=selectors)
+    else:
+        # Validate XML
+        validate_xml(XML_PATH)
+        
+        # Parse variables from XML
+        variables = parse_xml_variables()
     
     if not variables:
         print("⚠️  No variables found in XML. Creating catalog with default fields...")
@@ -498,49 +2329,61 @@ def main():
             }
         ]
 
-    print(f"\n🔗 Connecting to {INSTANCE_URL} as {USERNAME}...\n")
+    deploy_options = {
+        "poll_timeout": args.poll_timeout,
+        "sync": args.sync,
+        "attach_gzip": args.attach_gzip,
+        "export_gzip": args.export_gzip,
+        "xml_pending": xml_pending,
+        "import_set": args.import_set
+    }
 
-    # Create update set
-    update_set_sys_id, update_set_name = create_update_set()
-    
-    # Set as current update set
-    set_current_update_set(update_set_sys_id)
-    time.sleep(2)
-    
-    # Attach XML to update set
-    attach_xml(update_set_sys_id)
-    time.sleep(2)
-    
-    # Create catalog item
-    catalog_item_sys_id = create_catalog_item(update_set_sys_id)
-    time.sleep(2)
-    
-    # Add variables from XML to catalog item
-    add_catalog_variables(catalog_item_sys_id, upda te_set_sys_id, variables)
-    time.sleep(2)
-    
-    # Mark update set as complete
-    mark_complete(update_set_sys_id)
-    time.sleep(2)
-    
-    # Export update set as XML
-    export_filename = export_update_set(update_set_sys_id, update_set_name)
+    if args.plan:
+        snapshot = load_snapshot(args.snapshot) if args.snapshot else None
+        if snapshot and snapshot.get("instance_url") != INSTANCE_URL.rstrip("/"):
+            print(f"⚠️  Snapshot was taken from {snapshot.get('instance_url')}, planning for {INSTANCE_URL}")
+        if xml_pending is not None:
+            xml_pending.result()
+        plan = plan_deploy(variables, snapshot=snapshot, **deploy_options)
+        print_plan(plan)
+        if args.plan_json:
+            with open(args.plan_json, "w", encoding="utf-8") as f:
+                json.dump(plan, f, indent=2)
+            print(f"📄 Plan written to {args.plan_json}")
+        return
+
+    if targets:
+        # Checked up front: one target refusing must not leave the others half deployed
+        for target in targets:
+            DeployJournal.refuse_overwrite(journal_path(target["name"]), args.resume, args.fresh)
+        print(f"\n🔗 Deploying to {len(targets)} instance(s): {', '.join(t['name'] for t in targets)}\n")
+        try:
+            outcomes = deploy_targets(targets, variables, args.max_targets, args.resume, args.fresh,
+                                      **deploy_options)
+        finally:
+            RECORDER.print_summary()
+            RECORDER.write(args.metrics_jsonl, args.metrics_openmetrics)
+        if print_targets_report(targets, outcomes):
+            sys.exit(1)
+        return
 
-    # Success summary
-    print("\n" + "=" * 60)
-    print("🎉 CATALOG CREATED & UPDATE SET EXPORTED!")
-    print("=" * 60)
-    print(f"✅ Update Set: {update_set_name}")
-    print(f"✅ Variables from XML: {len(variables)}")
-    print(f"✅ Exported XML: {export_filename}")
-    print(f"\n🔗 View Update Set:")
-    print(f"   {INSTANCE_URL}/nav_to.do?uri=sys_update_set.do?sys_id={update_set_sys_id}")
-    print(f"\n📋 View Catalog Item:")
-    print(f"   {INSTANCE_URL}/nav_to.do?uri=sc_cat_item.do?sys_id={catalog_item_sys_id}")
-    print(f"\n🛒 Service Catalog Items List:")
-    print(f"   {INSTANCE_URL}/sc_cat_item_list.do")
-    print(f"\n📦 Export XML file saved locally: {export_filename}")
-    print("=" * 60)
+    print(f"\n🔗 Connecting to {INSTANCE_URL} as {USERNAME}...\n")
+
+    journal = DeployJournal.open(journal_path(), INSTANCE_URL, "single", args.resume, args.fresh)
+    try:
+        with ServiceNowClient(INSTANCE_URL, USERNAME, PASSWORD) as client:
+            result = deploy(client, variables, journal=journal, **deploy_options)
+    except BaseException:
+        print(f"\n💾 Progress kept in {journal.path}, rerun with --resume to continue")
+        raise
+    finally:
+        # Timings are most useful when a deploy is slow or fails, so always report them
+        RECORDER.print_summary()
+        RECORDER.write(args.metrics_jsonl, args.metrics_openmetrics)
+
+    journal.clear()
+    if result:
+        print_summary(INSTANCE_URL, result, variables)
 
 
 if __name__ == "__main__":
@@ -2,100 +2,314 @@
 import sys
 import os
 import re
-import xml.etree.ElementTree as ET
+import glob
+import json
+import hashlib
+import argparse
+import filecmp
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+
+from instrumentation import RECORDER, add_metrics_arguments, timed_step
 
 """
 Improved extractor:
+ - Lexes the file once into a block tree (type, labels, span, children)
+ - Indexes every block's attributes by path; --select exports any of them
  - Detects and logs whether locals and provider blocks are found
  - Parses multi-line values for simple assignments
- - Writes parsed content to terraform_vars.xml
+ - Caches parsed results by content hash and skips rewriting unchanged XML
+ - Streams parsed content to terraform_vars.xml
+ - Times each step and can write the timings as JSON lines or OpenMetrics
 """
 
-def strip_comments(line: str) -> str:
-    # Remove inline comments (# or //), keep content before comment
-    line = re.split(r'\s#', line, maxsplit=1)[0]
-    line = re.split(r'\s//', line, maxsplit=1)[0]
-    return line.rstrip()
-
-def find_block_spans(content: str, header_regex: str):
-    """Return list of (start,end) for block contents following header."""
-    spans = []
-    for m in re.finditer(header_regex, content, flags=re.IGNORECASE):
-        # find first '{' after match
-        pos = content.find('{', m.end())
-        if pos == -1:
-            continue
-        depth = 0
-        i = pos
-        while i < len(content):
-            c = content[i]
-            if c == '{':
-                depth += 1
-            elif c == '}':
-                depth -= 1
-                if depth == 0:
-                    spans.append((pos + 1, i))  # inner content only
-                    break
-            i += 1
-    return spans
-
-def collect_simple_assignments(block_text: str) -> dict:
-    """
-    Collects key = value assignments.
-    Handles values spanning multiple lines until a line ends with an unbalanced quote or comma.
-    Ignores nested blocks like "features {}" or "os_disk { ... }".
+PARSER_VERSION = "3"
+
+# One master pattern drives the whole lexer.  Alternatives are tried in order,
+# so comments, heredocs and strings are consumed before their contents could
+# be mistaken for braces or identifiers.
+_TOKEN_RE = re.compile(r"""
+    (?P<newline>\n)
+  | (?P<space>[ \t\r\f\v\xa0]+)
+  | (?P<comment>\#[^\n]*|//[^\n]*|/\*.*?(?:\*/|\Z))
+  | (?P<heredoc><<-?(?P<marker>[A-Za-z_][A-Za-z0-9_]*)[ \t]*\r?\n)
+  | (?P<string>"(?:[^"\\\n]|\\.)*"?)
+  | (?P<ident>[A-Za-z_][A-Za-z0-9_-]*)
+  | (?P<open>[{\[(])
+  | (?P<close>[}\])])
+  | (?P<op>==|!=|<=|>=|=>)
+  | (?P<equals>=)
+  | (?P<other>[^\s"\#/{}\[\]()<>=!A-Za-z_]+|.)
+""", re.VERBOSE | re.DOTALL)
+
+
+def _new_block(block_type, labels, start, body_start):
+    return {
+        "type": block_type,
+        "labels": labels,
+        "start": start,
+        "end": None,
+        "span": (body_start, None),
+        "attributes": {},
+        "children": [],
+    }
+
+
+@timed_step()
+def parse_blocks(content: str) -> list:
     """
-    result = {}
-    lines = block_text.splitlines()
-
-    # Remove lines that are pure block starters/enders to avoid nested objects
-    cleaned = []
-    brace_depth = 0
-    for raw in lines:
-        s = strip_comments(raw)
-        if not s.strip():
+    Lex the file once and return its top-level blocks as a tree.
+
+    Each block is a dict with "type", "labels", "start"/"end" (whole block),
+    "span" (inner content only), "attributes" (name -> value span) and
+    nested "children".  Braces inside strings, heredocs and comments are
+    ignored, so the tree is built in a single linear pass.
+    """
+    root = _new_block(None, [], 0, 0)
+    # frame: [block, header tokens, header start, attr name, value start, value end, expr depth]
+    stack = [[root, [], None, None, None, None, 0]]
+    pos = 0
+    n = len(content)
+
+    def finish_attribute(frame):
+        if frame[3] is not None and frame[4] is not None:
+            frame[0]["attributes"][frame[3]] = (frame[4], frame[5])
+        frame[3] = frame[4] = frame[5] = None
+
+    while pos < n:
+        m = _TOKEN_RE.match(content, pos)
+        kind = m.lastgroup
+        tok_start, pos = m.start(), m.end()
+        frame = stack[-1]
+
+        if kind == "marker":
+            kind = "heredoc"
+        if kind == "heredoc":
+            end_re = re.compile(r"^[ \t]*" + re.escape(m.group("marker")) + r"[ \t]*\r?$", re.MULTILINE)
+            term = end_re.search(content, pos)
+            pos = term.end() if term else n
+
+        if kind in ("space", "comment"):
             continue
-        # crude brace tracking to skip nested blocks
-        brace_depth += s.count('{')
-        brace_depth -= s.count('}')
-        if brace_depth > 0 and not re.match(r'^\s*[A-Za-z0-9_]+\s*=\s*', s):
-            # inside nested block and not an assignment
+
+        in_attr = frame[3] is not None
+        if kind == "newline":
+            if frame[6] == 0:
+                finish_attribute(frame)
+                frame[1] = []
+                frame[2] = None
             continue
-        cleaned.append(s)
-
-    # Reconstruct multi-line "key = value" statements
-    buf = []
-    for s in cleaned:
-        if re.match(r'^\s*[A-Za-z0-9_]+\s*=\s*', s) and not buf:
-            buf = [s]
-        elif buf:
-            buf.append(s)
-            # if line ends with closing quote or looks complete, try finalize
-            joined = ' '.join(buf).strip()
-            if balanced_assignment(joined):
-                parse_assignment_line(joined, result)
-                buf = []
+
+        if in_attr:
+            if kind == "open":
+                frame[6] += 1
+            elif kind == "close":
+                if frame[6] == 0:
+                    # closing brace of a one-line block, e.g. `features { a = 1 }`
+                    finish_attribute(frame)
+                    in_attr = False
+                else:
+                    frame[6] -= 1
+            if in_attr:
+                if frame[4] is None:
+                    frame[4] = tok_start
+                frame[5] = pos
+                continue
+
+        if kind == "ident":
+            if frame[2] is None:
+                frame[2] = tok_start
+            frame[1].append(m.group())
+        elif kind == "string" and frame[1]:
+            frame[1].append(m.group()[1:-1])
+        elif kind == "equals" and len(frame[1]) == 1:
+            frame[3] = frame[1][0]
+            frame[1] = []
+            frame[2] = None
+        elif kind == "open" and m.group() == "{" and frame[1]:
+            block = _new_block(frame[1][0], frame[1][1:], frame[2], pos)
+            frame[1] = []
+            frame[2] = None
+            stack.append([block, [], None, None, None, None, 0])
+        elif kind == "open":
+            frame[6] += 1
+        elif kind == "close":
+            if frame[6] > 0:
+                frame[6] -= 1
+            elif len(stack) > 1:
+                block = stack.pop()[0]
+                block["span"] = (block["span"][0], tok_start)
+                block["end"] = pos
+                stack[-1][0]["children"].append(block)
+                stack[-1][1] = []
+                stack[-1][2] = None
         else:
-            # single dangling non-assignment line: ignore
-            pass
-    # handle leftover buffer
-    if buf:
-        joined = ' '.join(buf).strip()
-        parse_assignment_line(joined, result)
+            frame[1] = []
+            frame[2] = None
+
+    # Blocks left open at EOF are unterminated and skipped, as before.
+    finish_attribute(stack[0])
+    return root["children"]
+
+
+def collect_simple_assignments(content: str, block: dict) -> dict:
+    """
+    Collects key = value assignments recorded for a block by parse_blocks.
+    Multi-line values are joined into a single line; nested blocks like
+    "features {}" or "os_disk { ... }" are children and therefore ignored.
+    Called once per block, so it is timed as part of build_index rather than on its own.
+    """
+    result = {}
+    for key, (start, end) in block["attributes"].items():
+        raw = content[start:end]
+        if "\n" in raw and not raw.startswith("<<"):
+            raw = " ".join(part.strip() for part in raw.splitlines() if part.strip())
+        result[key] = parse_value(raw)
+    return result
+
+
+class BlockIndex:
+    """
+    Every attribute of every block, keyed by its path: block type, labels,
+    then nested block types/labels and the attribute name, e.g.
+    ("resource", "azurerm_windows_virtual_machine", "winvm", "os_disk", "caching").
+    Paths and their prefixes are dict keys, so lookups are O(1) and a
+    selector only walks the branches it names. Repeated blocks merge like
+    dict.update: a later value replaces an earlier one in its original position.
+    """
+
+    def __init__(self):
+        self.values = {}
+        self.children = {(): {}}
+        self.block_counts = {}
 
+    def add(self, path: tuple, value):
+        for depth in range(len(path)):
+            self.children.setdefault(path[:depth], {})[path[depth]] = None
+        self.children.setdefault(path, {})
+        self.values[path] = value
+
+    def add_block(self, content: str, block: dict, prefix: tuple = ()):
+        path = prefix + (block["type"], *block["labels"])
+        if not prefix:
+            for depth in range(1, len(path) + 1):
+                self.block_counts[path[:depth]] = self.block_counts.get(path[:depth], 0) + 1
+        self.children.setdefault(path, {})
+        for key, value in collect_simple_assignments(content, block).items():
+            self.add(path + (key,), value)
+        for child in block["children"]:
+            self.add_block(content, child, path)
+
+    @classmethod
+    @timed_step("build_index")
+    def from_blocks(cls, content: str, blocks: list) -> "BlockIndex":
+        index = cls()
+        for block in blocks:
+            index.add_block(content, block)
+        return index
+
+    def count(self, *address) -> int:
+        """Number of top-level blocks whose type and leading labels are address"""
+        return self.block_counts.get(address, 0)
+
+    def get(self, path, default=None):
+        """Value at a path tuple or dotted path, e.g. "locals.vm_size" """
+        if isinstance(path, str):
+            path = tuple(path.split("."))
+        return self.values.get(path, default)
+
+    def select(self, selector: str) -> dict:
+        """
+        Values whose path matches a dotted selector, in file order. "*" matches
+        any one segment, e.g. "resource.azurerm_windows_virtual_machine.*.size"
+        or "provider.azurerm.*". Nested blocks are not values and never match.
+        """
+        paths = [()]
+        for segment in selector.split("."):
+            if segment == "*":
+                paths = [path + (child,) for path in paths for child in self.children.get(path, ())]
+            else:
+                paths = [path + (segment,) for path in paths if segment in self.children.get(path, ())]
+        return {path: self.values[path] for path in paths if path in self.values}
+
+    def resolve(self, value, max_depth: int = 8):
+        """Follow a value that is just `local.<name>` or `var.<name>` to what it refers to in this index"""
+        for _ in range(max_depth):
+            if not isinstance(value, str) or "." not in value:
+                return value
+            kind, _, name = value.partition(".")
+            if kind == "local" and ("locals", name) in self.values:
+                value = self.values[("locals", name)]
+            elif kind == "var" and ("variable", name, "default") in self.values:
+                value = self.values[("variable", name, "default")]
+            else:
+                return value
+        return value
+
+    def to_entry(self) -> dict:
+        """JSON-friendly form for the parse cache"""
+        return {
+            "values": [[list(path), value] for path, value in self.values.items()],
+            "blocks": [[list(address), n] for address, n in self.block_counts.items()],
+        }
+
+    @classmethod
+    def from_entry(cls, entry: dict) -> "BlockIndex":
+        index = cls()
+        for path, value in entry["values"]:
+            index.add(tuple(path), value)
+        index.block_counts = {tuple(address): n for address, n in entry["blocks"]}
+        return index
+
+
+def parse_selector(spec: str) -> tuple:
+    """Split a --select value, "NAME=SELECTOR" or just "SELECTOR", into (name or None, selector)"""
+    name, sep, selector = spec.partition("=")
+    if not sep:
+        return None, spec.strip()
+    return name.strip() or None, selector.strip()
+
+
+def selected_name(name, selector: str, path: tuple, matches: int) -> str:
+    """
+    Variable name for a selected value: the given name (suffixed with the
+    wildcard segments when several paths match), else the path without its
+    leading "resource"/"locals" type, joined with underscores.
+    """
+    if name:
+        if matches == 1:
+            return name
+        wild = [seg for seg, pattern in zip(path, selector.split(".")) if pattern == "*"]
+        return "_".join([name] + wild)
+    if path[0] in ("resource", "locals"):
+        path = path[1:]
+    return "_".join(path)
+
+
+def is_provider_credential(path: tuple) -> bool:
+    """Provider settings that are dropped or exported as Sensitive, so a selector must not copy them to locals"""
+    return path[0] == "provider" and path[-1] in SKIPPED_PROVIDER_KEYS | SENSITIVE_PROVIDER_KEYS
+
+
+def select_values(index: BlockIndex, selectors, log: list = None) -> dict:
+    """
+    Apply parsed (name, selector) pairs to an index; returns {variable name: resolved value}.
+    Provider credentials are never selected; each one skipped is noted in log.
+    """
+    result = {}
+    for name, selector in selectors:
+        matches = index.select(selector)
+        for path, value in matches.items():
+            if is_provider_credential(path):
+                if log is not None:
+                    log.append(f"[warn] not selecting provider credential {'.'.join(path)}")
+                continue
+            result[selected_name(name, selector, path, len(matches))] = index.resolve(value)
     return result
 
-def balanced_assignment(s: str) -> bool:
-    # naive check: if quotes balanced and parentheses balanced, consider complete
-    dq = s.count('"')
-    sq = s.count("'")
-    return dq % 2 == 0 and sq % 2 == 0
 
-def parse_assignment_line(line: str, out: dict):
-    m = re.match(r'^\s*([A-Za-z0-9_]+)\s*=\s*(.+?)\s*$', line)
-    if not m:
-        return
-    key, val = m.group(1), m.group(2).strip()
+def parse_value(val: str):
+    val = val.strip()
 
     # Trim trailing commas
     if val.endswith(','):
@@ -103,108 +317,347 @@ def parse_assignment_line(line: str, out: dict):
 
     # Remove quotes
     if len(val) >= 2 and ((val[0] == '"' and val[-1] == '"') or (val[0] == "'" and val[-1] == "'")):
-        val = val[1:-1]
-    elif val.lower() in ('true', 'false'):
-        val = (val.lower() == 'true')
-    else:
-        # Try numbers; else leave string (expressions remain as-is)
-        try:
-            if '.' in val:
-                val = float(val)
-            else:
-                val = int(val)
-        except ValueError:
-            pass
-    out[key] = val
+        return val[1:-1]
+    if val.lower() in ('true', 'false'):
+        return val.lower() == 'true'
+    # Try numbers; else leave string (expressions remain as-is)
+    try:
+        if '.' in val:
+            return float(val)
+        return int(val)
+    except ValueError:
+        return val
 
 def infer_type(v) -> str:
     if isinstance(v, bool): return "boolean"
     if isinstance(v, (int, float)): return "number"
     return "string"
 
-def pretty_print_xml(elem, level=0):
-    indent = "\n" + ("  " * level)
-    if len(elem):
-        if not elem.text or not elem.text.strip():
-            elem.text = indent + "  "
-        for child in elem:
-            pretty_print_xml(child, level + 1)
-        if not elem.tail or not elem.tail.strip():
-            elem.tail = indent
-    else:
-        if level and (not elem.tail or not elem.tail.strip()):
-            elem.tail = indent
+SKIPPED_PROVIDER_KEYS = {"client_secret"}  # avoid plaintext secrets
+SENSITIVE_PROVIDER_KEYS = {"tenant_id", "subscription_id", "client_id"}
 
-def write_xml(locals_dict: dict, provider_dict: dict, out_path: str):
-    root = ET.Element("TerraformVariables")
 
-    locals_el = ET.SubElement(root, "Locals")
-    for k, v in locals_dict.items():
-        var_el = ET.SubElement(locals_el, "Variable")
-        ET.SubElement(var_el, "Name").text = str(k)
-        ET.SubElement(var_el, "Value").text = str(v)
-        ET.SubElement(var_el, "Type").text = infer_type(v)
+def xml_escape(text: str) -> str:
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
 
-    provider_el = ET.SubElement(root, "Provider")
-    ET.SubElement(provider_el, "Name").text = "azurerm"
 
-    skip_keys = {"client_secret"}  # avoid plaintext secrets
-    for k, v in provider_dict.items():
-        if k in skip_keys:
+class XmlStreamWriter:
+    """
+    Writes elements straight to a text file, already indented.
+    Layout matches what the previous ElementTree + pretty_print_xml pair
+    produced: every element's tail is indented at its own level.
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.level = 0
+        self.pending = []  # containers whose start tag waits for a first child
+
+    def _flush_pending(self):
+        for tag in self.pending:
+            self.f.write(f"<{tag}>\n" + "  " * (self.level + 1))
+            self.level += 1
+        self.pending = []
+
+    def start(self, tag: str):
+        self._flush_pending()
+        self.pending.append(tag)
+
+    def leaf(self, tag: str, text: str):
+        self._flush_pending()
+        tail = "\n" + "  " * self.level
+        if text:
+            self.f.write(f"<{tag}>{xml_escape(text)}</{tag}>{tail}")
+        else:
+            self.f.write(f"<{tag} />{tail}")
+
+    def end(self, tag: str):
+        if self.pending:
+            # no children were written: ElementTree emits a short empty tag
+            self.pending.pop()
+            self.f.write(f"<{tag} />\n" + "  " * self.level)
+            return
+        self.level -= 1
+        self.f.write(f"</{tag}>\n" + "  " * self.level)
+
+
+@timed_step()
+def write_xml(locals_dict: dict, provider_dict: dict, out_path: str) -> bool:
+    """
+    Stream the variables to out_path. Returns False (and leaves the file
+    untouched) when the existing file already has identical content.
+    """
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+        f.write("<?xml version='1.0' encoding='utf-8'?>\n")
+        w = XmlStreamWriter(f)
+        w.start("TerraformVariables")
+
+        w.start("Locals")
+        for k, v in locals_dict.items():
+            w.start("Variable")
+            w.leaf("Name", str(k))
+            w.leaf("Value", str(v))
+            w.leaf("Type", infer_type(v))
+            w.end("Variable")
+        w.end("Locals")
+
+        w.start("Provider")
+        w.leaf("Name", "azurerm")
+        for k, v in provider_dict.items():
+            if k in SKIPPED_PROVIDER_KEYS:
+                continue
+            w.start("Setting")
+            w.leaf("Name", str(k))
+            w.leaf("Value", str(v))
+            w.leaf("Type", infer_type(v))
+            w.leaf("Sensitive", "true" if k in SENSITIVE_PROVIDER_KEYS else "false")
+            w.end("Setting")
+        w.end("Provider")
+
+        w.end("TerraformVariables")
+
+    # Leave an identical file untouched so its mtime (and CI path filters) don't change
+    if os.path.isfile(out_path) and filecmp.cmp(tmp_path, out_path, shallow=False):
+        os.remove(tmp_path)
+        return False
+    os.replace(tmp_path, out_path)
+    return True
+
+def cache_key(raw: bytes) -> str:
+    """Cache key for a file: its content hash salted with the parser version."""
+    h = hashlib.sha256()
+    h.update(PARSER_VERSION.encode("ascii") + b"\0")
+    h.update(raw)
+    return h.hexdigest()
+
+
+def cache_load(cache_dir: str, key: str):
+    path = os.path.join(cache_dir, key + ".json")
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    try:
+        os.utime(path)  # mark as recently used for eviction
+    except OSError:
+        pass
+    return entry
+
+
+def cache_store(cache_dir: str, key: str, entry: dict):
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, key + ".json")
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(entry, f)
+    os.replace(tmp, path)
+
+
+def prune_cache(cache_dir: str, max_bytes: int) -> int:
+    """Evict least recently used entries until the cache fits in max_bytes."""
+    try:
+        names = [n for n in os.listdir(cache_dir) if n.endswith(".json")]
+    except OSError:
+        return 0
+    entries = []
+    for name in names:
+        try:
+            st = os.stat(os.path.join(cache_dir, name))
+        except OSError:
             continue
-        var_el = ET.SubElement(provider_el, "Setting")
-        ET.SubElement(var_el, "Name").text = str(k)
-        ET.SubElement(var_el, "Value").text = str(v)
-        ET.SubElement(var_el, "Type").text = infer_type(v)
-        ET.SubElement(var_el, "Sensitive").text = "true" if k in {"tenant_id","subscription_id","client_id"} else "false"
+        entries.append((st.st_mtime, st.st_size, name))
+    entries.sort()
+    total = sum(size for _, size, _ in entries)
+    evicted = 0
+    for _, size, name in entries:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(os.path.join(cache_dir, name))
+        except OSError:
+            continue
+        total -= size
+        evicted += 1
+    return evicted
 
-    pretty_print_xml(root)
-    tree = ET.ElementTree(root)
-    tree.write(out_path, encoding="utf-8", xml_declaration=True)
 
-def main():
-    tf_path = sys.argv[1] if len(sys.argv) >= 2 else "main.tf"
+@timed_step()
+def extract_file(tf_path: str, cache_dir: str = None, selectors=()) -> dict:
+    """
+    Index one .tf file and return its locals/provider dicts. Values chosen by
+    selectors ((name, selector) pairs, see parse_selector) are appended to locals.
+    Log lines are returned rather than printed so parallel workers don't interleave.
+    When cache_dir is given, unchanged files are served from the cache without parsing.
+    """
+    with open(tf_path, "rb") as f:
+        raw = f.read()
 
-    if not os.path.isfile(tf_path):
-        print(f"ERROR: File not found: {tf_path}")
-        print("Tip: python .\\extract_tf_vars_to_xml.py .\\main.tf")
-        sys.exit(1)
+    key = cache_key(raw) if cache_dir else None
+    entry = cache_load(cache_dir, key) if key else None
+    log = []
+    if entry is not None:
+        index = BlockIndex.from_entry(entry)
+        log.append(f"[info] {tf_path}: cache hit")
+    else:
+        content = raw.decode("utf-8").replace("\r\n", "\n").replace("\r", "\n")
 
-    with open(tf_path, "r", encoding="utf-8") as f:
-        content = f.read()
+        # Normalize any encoded angle brackets
+        content = content.replace("&gt;", ">").replace("&lt;", "<")
 
-    # Normalize any encoded angle brackets
-    content = content.replace("&gt;", ">").replace("&lt;", "<")
+        index = BlockIndex.from_blocks(content, parse_blocks(content))
+        if key:
+            cache_store(cache_dir, key, index.to_entry())
 
     # Find locals
-    locals_spans = find_block_spans(content, r'\blocals\s*\{')
-    print(f"[info] locals blocks found: {len(locals_spans)}")
-    locals_dict = {}
-    for i, (start, end) in enumerate(locals_spans, 1):
-        block = content[start:end]
-        parsed = collect_simple_assignments(block)
-        print(f"[info] locals#{i} parsed keys: {list(parsed.keys())}")
-        locals_dict.update(parsed)
+    locals_dict = {path[-1]: value for path, value in index.select("locals.*").items()}
+    log.append(f"[info] {tf_path}: locals blocks found: {index.count('locals')}, "
+               f"parsed keys: {list(locals_dict)}")
 
     # Find provider "azurerm"
-    provider_spans = find_block_spans(content, r'\bprovider\s+"azurerm"\s*\{')
-    print(f"[info] azurerm provider blocks found: {len(provider_spans)}")
-    provider_dict = {}
-    for i, (start, end) in enumerate(provider_spans, 1):
-        block = content[start:end]
-        parsed = collect_simple_assignments(block)
-        print(f"[info] provider#{i} parsed keys: {list(parsed.keys())}")
-        provider_dict.update(parsed)
-
-    out_path = "terraform_vars.xml"
-    write_xml(locals_dict, provider_dict, out_path)
-
-    print(f"\n✅ Done. Wrote variables/settings to: {out_path}")
+    provider_dict = {path[-1]: value for path, value in index.select("provider.azurerm.*").items()}
+    log.append(f"[info] {tf_path}: azurerm provider blocks found: {index.count('provider', 'azurerm')}, "
+               f"parsed keys: {list(provider_dict)}")
+
+    if selectors:
+        selected = select_values(index, selectors, log)
+        log.append(f"[info] {tf_path}: selected keys: {list(selected)}")
+        locals_dict.update(selected)
+
+    return {"path": tf_path, "locals": locals_dict, "provider": provider_dict, "log": log}
+
+
+@timed_step()
+def discover_tf_files(inputs: list) -> tuple:
+    """
+    Expand files, directories (searched recursively) and glob patterns into a
+    sorted, de-duplicated list of .tf files. Inputs that match nothing are
+    returned in a second list so the caller can report them.
+    """
+    found = {}
+    missing = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for dirpath, dirnames, filenames in os.walk(item):
+                # Provider caches and hidden dirs never hold stack sources
+                dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+                for name in filenames:
+                    if name.endswith(".tf"):
+                        path = os.path.join(dirpath, name)
+                        found.setdefault(os.path.realpath(path), path)
+        elif os.path.isfile(item):
+            found.setdefault(os.path.realpath(item), item)
+        elif glob.has_magic(item):
+            for path in glob.glob(item, recursive=True):
+                if os.path.isfile(path) and path.endswith(".tf"):
+                    found.setdefault(os.path.realpath(path), path)
+        else:
+            missing.append(item)
+    files = sorted(found.values(), key=lambda p: os.path.normpath(p))
+    return files, missing
+
+
+def extract_files(tf_paths: list, jobs: int = None, cache_dir: str = None, selectors=()) -> list:
+    """Parse files on a process pool; results come back in input order."""
+    if len(tf_paths) <= 1 or jobs == 1:
+        return [extract_file(p, cache_dir, selectors) for p in tf_paths]
+    # Workers start with an empty recorder and ship their step timings back with each result
+    with ProcessPoolExecutor(max_workers=jobs, initializer=RECORDER.drain) as pool:
+        results = list(pool.map(partial(_extract_file_with_metrics, cache_dir=cache_dir, selectors=selectors),
+                                tf_paths))
+    for res in results:
+        RECORDER.extend(res.pop("metrics"))
+    return results
+
+
+def _extract_file_with_metrics(tf_path: str, cache_dir: str = None, selectors=()) -> dict:
+    res = extract_file(tf_path, cache_dir, selectors)
+    res["metrics"] = RECORDER.drain()
+    return res
+
+
+@timed_step()
+def merge_results(results: list):
+    """
+    Merge per-file results in the (sorted) order given. Later files win, like
+    dict.update within one file; keys defined with different values in more
+    than one file are reported as conflicts.
+    """
+    merged = {"locals": {}, "provider": {}}
+    origin = {"locals": {}, "provider": {}}
+    conflicts = []
+    for res in results:
+        for section in ("locals", "provider"):
+            for k, v in res[section].items():
+                if k in merged[section] and merged[section][k] != v:
+                    conflicts.append((section, k, origin[section][k], res["path"]))
+                merged[section][k] = v
+                origin[section][k] = res["path"]
+    return merged["locals"], merged["provider"], conflicts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract Terraform locals/provider settings to XML")
+    parser.add_argument("paths", nargs="*", default=["main.tf"],
+                        help=".tf files, module directories or glob patterns (default: main.tf)")
+    parser.add_argument("-o", "--output", default="terraform_vars.xml", help="XML output path")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="parallel parser processes (default: CPU count)")
+    parser.add_argument("--cache-dir", default=".tf_extract_cache",
+                        help="directory for the parsed-file cache (default: .tf_extract_cache)")
+    parser.add_argument("--no-cache", action="store_true", help="always re-parse every file")
+    parser.add_argument("--cache-max-mb", type=float, default=64,
+                        help="evict least recently used cache entries above this size (default: 64)")
+    parser.add_argument("--fail-on-conflict", action="store_true",
+                        help="exit non-zero if the same key is defined differently in two files")
+    parser.add_argument("--select", action="append", default=[], metavar="[NAME=]SELECTOR",
+                        help="also export the values at a block path as locals, e.g. "
+                             "resource.azurerm_windows_virtual_machine.*.size (repeatable; provider credentials are never selected)")
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    selectors = [parse_selector(spec) for spec in args.select]
+    if any(not selector for _, selector in selectors):
+        parser.error("--select needs a selector, e.g. resource.azurerm_windows_virtual_machine.*.size")
+
+    tf_files, missing = discover_tf_files(args.paths)
+    if missing or not tf_files:
+        for item in missing or args.paths:
+            print(f"ERROR: File not found: {item}")
+        print("Tip: python .\\extract_tf_vars_to_xml.py .\\main.tf")
+        sys.exit(1)
+
+    print(f"[info] .tf files to parse: {len(tf_files)}")
+    cache_dir = None if args.no_cache else args.cache_dir
+    results = extract_files(tf_files, args.jobs, cache_dir, selectors)
+    if cache_dir:
+        evicted = prune_cache(cache_dir, int(args.cache_max_mb * 1024 * 1024))
+        if evicted:
+            print(f"[info] cache entries evicted: {evicted}")
+    for res in results:
+        for line in res["log"]:
+            print(line)
+
+    locals_dict, provider_dict, conflicts = merge_results(results)
+    for section, key, first, second in conflicts:
+        print(f"[warn] conflicting {section} key '{key}': {first} overridden by {second}")
+    if conflicts and args.fail_on_conflict:
+        print(f"ERROR: {len(conflicts)} conflicting key(s) found")
+        sys.exit(1)
+
+    out_path = args.output
+    if write_xml(locals_dict, provider_dict, out_path):
+        print(f"\n✅ Done. Wrote variables/settings to: {out_path}")
+    else:
+        print(f"\n✅ Done. {out_path} is already up to date (not rewritten)")
     print(f"   • Locals extracted: {len(locals_dict)}")
     shown_provider = {k: v for k, v in provider_dict.items() if k != "client_secret"}
     print(f"   • Provider settings extracted (excluding client_secret): {len(shown_provider)}")
     if "client_secret" in provider_dict:
         print("   • client_secret detected but not written (skipped by default).")
 
+    RECORDER.print_summary()
+    RECORDER.write(args.metrics_jsonl, args.metrics_openmetrics)
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,183 @@
+import functools
+import json
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+"""
+Timing and metrics shared by the extractor and the deploy script:
+ - Records every pipeline step and HTTP call (duration, bytes, status, retries)
+ - Writes the records as JSON lines or an OpenMetrics text file
+ - Prints a per-step / per-endpoint summary table at the end of a run
+"""
+
+_SYS_ID_RE = re.compile(r"/[0-9a-f]{32}(?=/|$)")
+
+
+def endpoint_name(path):
+    """Path without its query string and with sys_ids collapsed, so calls to one endpoint aggregate"""
+    return _SYS_ID_RE.sub("/{sys_id}", path.split("?", 1)[0])
+
+
+class Recorder:
+    """Thread-safe collector of timing records"""
+
+    def __init__(self):
+        self.records = []
+        self.lock = threading.Lock()
+
+    def record(self, kind, name, duration, **fields):
+        entry = {"kind": kind, "name": name, "duration_s": round(duration, 6), "ts": time.time()}
+        entry.update(fields)
+        with self.lock:
+            self.records.append(entry)
+        return entry
+
+    def record_http(self, method, path, duration, status=None, bytes_out=0, bytes_in=0, retries=0, **fields):
+        endpoint = endpoint_name(path)
+        return self.record(
+            "http", f"{method} {endpoint}", duration,
+            method=method, endpoint=endpoint, status=status,
+            bytes_out=bytes_out, bytes_in=bytes_in, retries=retries, **fields
+        )
+
+    @contextmanager
+    def step(self, name):
+        """Time a pipeline step; failures are recorded too"""
+        start = time.perf_counter()
+        ok = True
+        try:
+            yield
+        except BaseException:
+            ok = False
+            raise
+        finally:
+            self.record("step", name, time.perf_counter() - start, ok=ok)
+
+    def drain(self):
+        """Remove and return all records (used to ship records out of worker processes)"""
+        with self.lock:
+            records, self.records = self.records, []
+        return records
+
+    def extend(self, records):
+        with self.lock:
+            self.records.extend(records)
+
+    # ---------------------------------------------------------- output
+
+    def summary(self):
+        """Aggregate records by (kind, name)"""
+        rows = {}
+        with self.lock:
+            records = list(self.records)
+        for r in records:
+            row = rows.setdefault((r["kind"], r["name"]), {
+                "kind": r["kind"], "name": r["name"], "count": 0, "total_s": 0.0, "max_s": 0.0,
+                "bytes_out": 0, "bytes_in": 0, "retries": 0, "errors": 0
+            })
+            row["count"] += 1
+            row["total_s"] += r["duration_s"]
+            row["max_s"] = max(row["max_s"], r["duration_s"])
+            row["bytes_out"] += r.get("bytes_out", 0) or 0
+            row["bytes_in"] += r.get("bytes_in", 0) or 0
+            row["retries"] += r.get("retries", 0) or 0
+            status = r.get("status")
+            if r.get("ok") is False or (r["kind"] == "http" and (status is None or status >= 400)):
+                row["errors"] += 1
+        return sorted(rows.values(), key=lambda row: (row["kind"] != "step", -row["total_s"]))
+
+    def print_summary(self, title="⏱️  TIMING SUMMARY"):
+        rows = self.summary()
+        if not rows:
+            return
+        width = max(len(row["name"]) for row in rows)
+        width = min(max(width, 10), 60)
+        print("\n" + title)
+        print(f"{'kind':<5} {'name':<{width}} {'count':>6} {'total s':>9} {'avg ms':>9} {'max ms':>9} "
+              f"{'sent':>10} {'recv':>10} {'retry':>5} {'err':>4}")
+        for row in rows:
+            avg_ms = row["total_s"] / row["count"] * 1000
+            print(f"{row['kind']:<5} {row['name'][:width]:<{width}} {row['count']:>6} {row['total_s']:>9.3f} "
+                  f"{avg_ms:>9.1f} {row['max_s'] * 1000:>9.1f} {row['bytes_out']:>10} {row['bytes_in']:>10} "
+                  f"{row['retries']:>5} {row['errors']:>4}")
+
+    def write_jsonl(self, path):
+        with self.lock:
+            records = list(self.records)
+        with open(path, "w", encoding="utf-8") as f:
+            for r in records:
+                f.write(json.dumps(r) + "\n")
+
+    def write_openmetrics(self, path, prefix="tf_catalog"):
+        lines = []
+
+        def label(value):
+            return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+        rows = self.summary()
+        steps = [row for row in rows if row["kind"] == "step"]
+        http = [row for row in rows if row["kind"] == "http"]
+
+        lines.append(f"# TYPE {prefix}_step_duration_seconds summary")
+        lines.append(f"# HELP {prefix}_step_duration_seconds Wall time spent in each pipeline step.")
+        for row in steps:
+            labels = f'step="{label(row["name"])}"'
+            lines.append(f"{prefix}_step_duration_seconds_count{{{labels}}} {row['count']}")
+            lines.append(f"{prefix}_step_duration_seconds_sum{{{labels}}} {row['total_s']:.6f}")
+
+        families = (
+            ("http_request_duration_seconds", "summary", "Duration of HTTP calls per endpoint."),
+            ("http_request_bytes", "counter", "Request bytes sent per endpoint."),
+            ("http_response_bytes", "counter", "Response bytes received per endpoint."),
+            ("http_retries", "counter", "Retries performed per endpoint."),
+            ("http_errors", "counter", "Failed calls (status >= 400 or no response) per endpoint."),
+        )
+        for family, mtype, help_text in families if http else ():
+            lines.append(f"# TYPE {prefix}_{family} {mtype}")
+            lines.append(f"# HELP {prefix}_{family} {help_text}")
+            for row in http:
+                labels = f'call="{label(row["name"])}"'
+                if family == "http_request_duration_seconds":
+                    lines.append(f"{prefix}_{family}_count{{{labels}}} {row['count']}")
+                    lines.append(f"{prefix}_{family}_sum{{{labels}}} {row['total_s']:.6f}")
+                else:
+                    key = {"http_request_bytes": "bytes_out", "http_response_bytes": "bytes_in",
+                           "http_retries": "retries", "http_errors": "errors"}[family]
+                    lines.append(f"{prefix}_{family}_total{{{labels}}} {row[key]}")
+
+        lines.append("# EOF")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+    def write(self, jsonl_path=None, openmetrics_path=None):
+        """Write whichever output files were requested"""
+        if jsonl_path:
+            self.write_jsonl(jsonl_path)
+            print(f"📄 Metrics written to {jsonl_path}")
+        if openmetrics_path:
+            self.write_openmetrics(openmetrics_path)
+            print(f"📄 OpenMetrics written to {openmetrics_path}")
+
+
+RECORDER = Recorder()
+
+
+def timed_step(name=None):
+    """Decorator recording each call of a function as a pipeline step"""
+    def decorate(func):
+        step_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with RECORDER.step(step_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def add_metrics_arguments(parser):
+    """Add the --metrics-jsonl / --metrics-openmetrics options to an argparse parser"""
+    parser.add_argument("--metrics-jsonl", metavar="PATH", help="write per-call timing records as JSON lines")
+    parser.add_argument("--metrics-openmetrics", metavar="PATH", help="write aggregated metrics in OpenMetrics text format")
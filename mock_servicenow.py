@@ -0,0 +1,436 @@
+import argparse
+import base64
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+"""
+Local stand-in for the ServiceNow endpoints used by create_update_set_and_upload_xml.py.
+
+ - Table API (GET/POST/PATCH/DELETE) for any table, kept in memory
+ - Batch API, attachment upload/list/download, update set export
+ - Import Set insertMultiple with an asynchronous transform into the target table
+   (synchronous with transform_delay=0)
+ - Configurable latency, error injection and rate limiting
+ - Counts requests and bytes so benchmark_deploy.py can report them
+"""
+
+REFERENCE_FIELDS = {"cat_item", "sys_update_set", "category", "sc_catalogs", "table_sys_id", "user", "sys_import_set"}
+
+# Staging table -> target table; staging columns are the target's fields prefixed with u_
+TRANSFORM_MAPS = {"u_tf_catalog_variable_import": "item_option_new"}
+
+
+def match_query(record: dict, query: str) -> bool:
+    """Evaluate the subset of encoded queries the deploy script sends."""
+    if not query:
+        return True
+    for part in query.split("^NQ"):
+        groups = []
+        for clause in part.split("^"):
+            if not clause or clause.startswith("ORDERBY"):
+                continue
+            if clause.startswith("OR") and groups:
+                groups[-1].append(clause[2:])
+            else:
+                groups.append([clause])
+        if all(any(match_clause(record, c) for c in group) for group in groups):
+            return True
+    return False
+
+
+def match_clause(record: dict, clause: str) -> bool:
+    for op in ("ISNOTEMPTY", "ISEMPTY"):
+        if clause.endswith(op):
+            value = record.get(clause[:-len(op)], "")
+            return bool(value) if op == "ISNOTEMPTY" else not value
+    for op in ("STARTSWITH", "NOT IN", "IN", "!=", "<=", ">=", "<", ">", "="):
+        field, sep, value = clause.partition(op)
+        if not sep or not field.isidentifier():
+            continue
+        have = str(record.get(field, ""))
+        if op == "STARTSWITH":
+            return have.startswith(value)
+        if op == "NOT IN":
+            return have not in value.split(",")
+        if op == "IN":
+            return have in value.split(",")
+        if op == "!=":
+            return have != value
+        if op == "<=":
+            return have <= value
+        if op == ">=":
+            return have >= value
+        if op == "<":
+            return have < value
+        if op == ">":
+            return have > value
+        return have == value
+    return False
+
+
+def order_by(query: str):
+    for clause in (query or "").split("^"):
+        if clause.startswith("ORDERBYDESC"):
+            return clause[len("ORDERBYDESC"):], True
+        if clause.startswith("ORDERBY"):
+            return clause[len("ORDERBY"):], False
+    return None, False
+
+
+class MockServiceNow:
+    """In-memory instance state plus the knobs used to simulate a slow or flaky instance."""
+
+    def __init__(self, latency=0.0, error_rate=0.0, rate_limit=0.0, seed=None, transform_delay=0.05):
+        self.latency = latency
+        self.transform_delay = transform_delay
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.tables = {}
+        self.attachments = {}
+        self.reset_stats()
+        self._bucket = rate_limit
+        self._bucket_ts = time.monotonic()
+
+        self.insert("sc_catalog", {"title": "Service Catalog"})
+        self.insert("sc_category", {"title": "Hardware"})
+
+    def reset_stats(self):
+        self.stats = {"connections": 0, "requests": 0, "bytes_in": 0, "bytes_out": 0, "by_endpoint": {}}
+
+    # ---------------------------------------------------------- records
+
+    def insert(self, table: str, values: dict) -> dict:
+        now = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        record = {
+            "sys_id": uuid.uuid4().hex,
+            "sys_created_on": now,
+            "sys_created_by": "admin",
+            "sys_updated_on": now,
+            "sys_updated_by": "admin",
+            "sys_mod_count": "0",
+            "sys_tags": "",
+            "sys_class_name": table,
+            "sys_domain": {"link": "https://mock/api/now/table/sys_user_group/global", "value": "global"},
+        }
+        record.update({k: "" if v is None else str(v) for k, v in values.items()})
+        with self.lock:
+            self.tables.setdefault(table, {})[record["sys_id"]] = record
+        return record
+
+    def render(self, table: str, record: dict, params: dict) -> dict:
+        fields = params.get("sysparm_fields")
+        exclude_links = params.get("sysparm_exclude_reference_link") == "true"
+        out = {}
+        for key, value in record.items():
+            if fields and key not in fields.split(","):
+                continue
+            if key in REFERENCE_FIELDS and value and not exclude_links and isinstance(value, str):
+                value = {"link": f"https://mock/api/now/table/{table}/{value}", "value": value}
+            elif isinstance(value, dict) and exclude_links:
+                value = value["value"]
+            out[key] = value
+        return out
+
+    # ---------------------------------------------------------- throttling
+
+    def _take_token(self) -> float:
+        """Return 0 if the request may proceed, else seconds to wait."""
+        if not self.rate_limit:
+            return 0.0
+        with self.lock:
+            now = time.monotonic()
+            self._bucket = min(self.rate_limit, self._bucket + (now - self._bucket_ts) * self.rate_limit)
+            self._bucket_ts = now
+            if self._bucket >= 1:
+                self._bucket -= 1
+                return 0.0
+            return (1 - self._bucket) / self.rate_limit
+
+    # ---------------------------------------------------------- dispatch
+
+    def handle(self, method: str, raw_path: str, headers: dict, body: bytes):
+        """Return (status, headers, body bytes) for one request."""
+        parsed = urlparse(raw_path)
+        params = {k: v[-1] for k, v in parse_qs(parsed.query, keep_blank_values=True).items()}
+        path = parsed.path.rstrip("/")
+
+        if path == "/api/now/v1/batch" and method == "POST":
+            return self.batch(json.loads(body or b"{}"))
+        if path == "/api/now/attachment/file" and method == "POST":
+            return self.attachment_upload(params, headers, body)
+        if path.startswith("/api/now/attachment"):
+            return self.attachment_read(method, path, params)
+        if path == "/sys_remote_update_set.do":
+            return self.export(params, headers)
+        if path.startswith("/api/now/stats/"):
+            table = path.split("/")[-1]
+            count = sum(1 for r in self.tables.get(table, {}).values() if match_query(r, params.get("sysparm_query")))
+            return self.json(200, {"result": {"stats": {"count": str(count)}}})
+        if path.startswith("/api/now/import/"):
+            return self.import_set(method, path, params, body)
+        if path.startswith("/api/now/table/"):
+            return self.table(method, path, params, body)
+        return self.json(404, {"error": {"message": f"No handler for {path}"}})
+
+    def json(self, status, payload, extra_headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        hdrs = {"Content-Type": "application/json"}
+        hdrs.update(extra_headers or {})
+        return status, hdrs, data
+
+    def table(self, method, path, params, body):
+        parts = path.split("/")[4:]
+        table = parts[0]
+        sys_id = parts[1] if len(parts) > 1 else None
+        rows = self.tables.setdefault(table, {})
+
+        if method == "GET" and sys_id:
+            record = rows.get(sys_id)
+            if record is None:
+                return self.json(404, {"error": {"message": "No Record found"}})
+            return self.json(200, {"result": self.render(table, record, params)})
+        if method == "GET":
+            query = params.get("sysparm_query", "")
+            with self.lock:
+                matched = [r for r in rows.values() if match_query(r, query)]
+            field, desc = order_by(query)
+            if field:
+                matched.sort(key=lambda r: str(r.get(field, "")), reverse=desc)
+            total = len(matched)
+            offset = int(params.get("sysparm_offset", 0) or 0)
+            limit = int(params.get("sysparm_limit", 10000) or 10000)
+            page = matched[offset:offset + limit]
+            extra = {"X-Total-Count": str(total)}
+            if params.get("sysparm_suppress_pagination_header") != "true":
+                extra["Link"] = ", ".join(
+                    f'<https://mock/api/now/table/{table}?sysparm_offset={o}&sysparm_limit={limit}>;rel="{rel}"'
+                    for rel, o in (("first", 0), ("next", offset + limit), ("last", max(total - limit, 0)))
+                )
+            return self.json(200, {"result": [self.render(table, r, params) for r in page]}, extra)
+        if method == "POST":
+            record = self.insert(table, json.loads(body or b"{}"))
+            return self.json(201, {"result": self.render(table, record, params)})
+        if method in ("PATCH", "PUT") and sys_id:
+            record = rows.get(sys_id)
+            if record is None:
+                return self.json(404, {"error": {"message": "No Record found"}})
+            with self.lock:
+                record.update({k: str(v) for k, v in json.loads(body or b"{}").items()})
+                record["sys_mod_count"] = str(int(record["sys_mod_count"]) + 1)
+            return self.json(200, {"result": self.render(table, record, params)})
+        if method == "DELETE" and sys_id:
+            with self.lock:
+                existed = rows.pop(sys_id, None)
+            return (204, {}, b"") if existed else self.json(404, {"error": {"message": "No Record found"}})
+        return self.json(405, {"error": {"message": "Method not allowed"}})
+
+    def batch(self, payload):
+        serviced = []
+        for req in payload.get("rest_requests", []):
+            body = base64.b64decode(req.get("body") or b"")
+            hdrs = {h["name"]: h["value"] for h in req.get("headers", [])}
+            if self.error_rate and self.random.random() < self.error_rate:
+                status, out_headers, out_body = self.json(503, {"error": {"message": "Injected failure"}})
+            else:
+                status, out_headers, out_body = self.handle(req.get("method", "GET"), req["url"], hdrs, body)
+            serviced.append({
+                "id": req["id"],
+                "status_code": status,
+                "status_text": "OK" if status < 400 else "Error",
+                "headers": [{"name": k, "value": v} for k, v in out_headers.items()],
+                "body": base64.b64encode(out_body).decode("ascii"),
+                "execution_time": 1,
+            })
+        return self.json(200, {
+            "batch_request_id": payload.get("batch_request_id"),
+            "serviced_requests": serviced,
+            "unserviced_requests": [],
+        })
+
+    def attachment_upload(self, params, headers, body):
+        record = self.insert("sys_attachment", {
+            "table_name": params.get("table_name", ""),
+            "table_sys_id": params.get("table_sys_id", ""),
+            "file_name": params.get("file_name", ""),
+            "content_type": headers.get("Content-Type", ""),
+            "size_bytes": len(body),
+            "hash": hashlib.sha256(body).hexdigest(),
+        })
+        self.attachments[record["sys_id"]] = body
+        return self.json(201, {"result": self.render("sys_attachment", record, params)})
+
+    def attachment_read(self, method, path, params):
+        rows = self.tables.setdefault("sys_attachment", {})
+        parts = path.split("/")[4:]
+        if not parts:
+            matched = [r for r in rows.values() if match_query(r, params.get("sysparm_query", ""))]
+            limit = int(params.get("sysparm_limit", 10000) or 10000)
+            return self.json(200, {"result": [self.render("sys_attachment", r, params) for r in matched[:limit]]})
+        record = rows.get(parts[0])
+        if record is None:
+            return self.json(404, {"error": {"message": "Record doesn't exist"}})
+        if len(parts) > 1 and parts[1] == "file":
+            return 200, {"Content-Type": record["content_type"]}, self.attachments[parts[0]]
+        return self.json(200, {"result": self.render("sys_attachment", record, params)})
+
+    def export(self, params, headers):
+        sys_id = params.get("sysparm_sys_id", "")
+        update_set = self.tables.get("sys_update_set", {}).get(sys_id)
+        if update_set is None:
+            return 404, {"Content-Type": "text/html"}, b"<html>Not found</html>"
+        lines = ["<?xml version=\"1.0\" encoding=\"UTF-8\"?>", "<unload>"]
+        lines.append(f"<sys_remote_update_set><name>{update_set['name']}</name></sys_remote_update_set>")
+        for table, rows in self.tables.items():
+            for record in rows.values():
+                if record.get("sys_update_set") == sys_id:
+                    lines.append(f"<sys_update_xml><table>{table}</table><payload>"
+                                 f"{json.dumps(record).replace('<', '&lt;')}</payload></sys_update_xml>")
+        lines.append("</unload>")
+        data = "\n".join(lines).encode("utf-8")
+
+        hdrs = {"Content-Type": "application/xml", "Accept-Ranges": "bytes"}
+        rng = headers.get("Range", "")
+        if rng.startswith("bytes="):
+            start = int(rng[6:].split("-")[0] or 0)
+            hdrs["Content-Range"] = f"bytes {start}-{len(data) - 1}/{len(data)}"
+            return 206, hdrs, data[start:]
+        return 200, hdrs, data
+
+    def import_set(self, method, path, params, body):
+        parts = path.split("/")[4:]
+        table = parts[0]
+        if table not in TRANSFORM_MAPS:
+            return self.json(404, {"error": {"message": f"Invalid table {table}"}})
+        if method != "POST" or parts[1:] not in ([], ["insertMultiple"]):
+            return self.json(405, {"error": {"message": "Method not allowed"}})
+
+        payload = json.loads(body or b"{}")
+        records = payload.get("records") if parts[1:] else [payload]
+        import_set = self.insert("sys_import_set", {"table_name": table, "state": "loading"})
+        rows = [
+            self.insert(table, dict(record, sys_import_set=import_set["sys_id"], sys_import_state="pending"))
+            for record in records
+        ]
+        import_set["state"] = "loaded"
+
+        if not parts[1:]:
+            # Single-row inserts are transformed synchronously, like the real API
+            self.transform(import_set, rows)
+            row = rows[0]
+            return self.json(201, {"import_set": import_set["sys_id"], "staging_table": table, "result": [{
+                "transform_map": "mock", "table": TRANSFORM_MAPS[table], "status": row["sys_import_state"],
+                "sys_id": row["sys_target_sys_id"], "status_message": row.get("sys_import_state_comment", "")
+            }]})
+
+        if self.transform_delay:
+            threading.Timer(self.transform_delay, self.transform, (import_set, rows)).start()
+        else:
+            # transform_delay=0 (offline plans) transforms inline, so the first poll sees the result
+            self.transform(import_set, rows)
+        return self.json(201, {"import_set_id": import_set["sys_id"], "multi_import_set_id": uuid.uuid4().hex})
+
+    def transform(self, import_set, rows):
+        """Run the transform map over staged rows, with per-row errors at error_rate"""
+        target = TRANSFORM_MAPS[import_set["table_name"]]
+        for row in rows:
+            values = {k[2:]: v for k, v in row.items() if k.startswith("u_")}
+            with self.lock:
+                fail = self.error_rate and self.random.random() < self.error_rate
+            if fail or not values.get("name"):
+                update = {"sys_import_state": "error", "sys_target_sys_id": "",
+                          "sys_import_state_comment": "Injected transform failure" if fail else "Target name is empty"}
+            else:
+                record = self.insert(target, values)
+                update = {"sys_import_state": "inserted", "sys_target_table": target,
+                          "sys_target_sys_id": record["sys_id"], "sys_import_state_comment": ""}
+            with self.lock:
+                row.update(update)
+        import_set["state"] = "processed"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        with self.server.mock.lock:
+            self.server.mock.stats["connections"] += 1
+
+    def _serve(self):
+        mock = self.server.mock
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        headers = {k: v for k, v in self.headers.items()}
+
+        if mock.latency:
+            time.sleep(mock.latency)
+
+        wait = mock._take_token()
+        if wait:
+            status, out_headers, data = mock.json(429, {"error": {"message": "Rate limit exceeded"}},
+                                                  {"Retry-After": f"{wait:.3f}"})
+        elif mock.error_rate and mock.random.random() < mock.error_rate:
+            status, out_headers, data = mock.json(503, {"error": {"message": "Injected failure"}})
+        else:
+            status, out_headers, data = mock.handle(self.command, self.path, headers, body)
+
+        endpoint = urlparse(self.path).path
+        if endpoint.startswith("/api/now/table/"):
+            endpoint = "/api/now/table/" + endpoint.split("/")[4]
+        with mock.lock:
+            mock.stats["requests"] += 1
+            mock.stats["bytes_in"] += len(body) + len(self.requestline) + sum(len(k) + len(v) + 4 for k, v in headers.items())
+            mock.stats["bytes_out"] += len(data)
+            mock.stats["by_endpoint"][endpoint] = mock.stats["by_endpoint"].get(endpoint, 0) + 1
+
+        self.send_response(status)
+        for k, v in out_headers.items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_POST = do_PATCH = do_PUT = do_DELETE = _serve
+
+
+def start_server(mock: MockServiceNow, host="127.0.0.1", port=0):
+    """Start serving mock on a background thread; returns (server, base_url)."""
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    server.mock = mock
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local mock ServiceNow instance")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="requests per second before 429s (0 = off)")
+    args = parser.parse_args()
+
+    mock = MockServiceNow(args.latency, args.error_rate, args.rate_limit)
+    server, url = start_server(mock, port=args.port)
+    print(f"🧪 Mock ServiceNow listening on {url} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+import pytest
+
+import create_update_set_and_upload_xml as deploy_script
+from create_update_set_and_upload_xml import OfflineAdapter, ServiceNowClient
+from mock_servicenow import MockServiceNow
+
+
+@pytest.fixture
+def connect(tmp_path, monkeypatch):
+    """ServiceNowClient whose requests are answered in-process by a MockServiceNow"""
+    monkeypatch.setattr(deploy_script, "RETRY_BACKOFF", 0.001)
+
+    def connect(mock, **options):
+        client = ServiceNowClient("https://mock.example", "admin", "admin", rate_limit=0,
+                                  lookup_cache_path=str(tmp_path / "lookup_cache.json"), **options)
+        client.session.mount("https://", OfflineAdapter(mock))
+        return client
+
+    return connect
+
+
+def variables(n):
+    return [
+        {"name": f"v{i}", "question_text": f"V{i}", "type": "6", "mandatory": "false", "order": str(i)}
+        for i in range(n)
+    ]
+
+
+class LostBatchResponse(MockServiceNow):
+    """Processes every batch, then answers 504 as if the gateway timed out"""
+
+    def batch(self, payload):
+        super().batch(payload)
+        return self.json(504, {"error": {"message": "Gateway timeout"}})
+
+
+def test_processed_batch_answered_504_adopts_instead_of_duplicating(connect):
+    mock = LostBatchResponse()
+    with connect(mock, max_retries=1) as client:
+        created = deploy_script.add_catalog_variables(client, "item1", "us1", variables(20), batch_size=5)
+
+    rows = mock.tables["item_option_new"]
+    assert len(rows) == 20
+    assert sorted(created) == sorted(rows)
+
+
+class FailingCreates(MockServiceNow):
+    """Answers the first `failures` POSTs to table with status, then behaves"""
+
+    def __init__(self, table, status, failures, retry_after=None):
+        super().__init__()
+        self.target = f"/api/now/table/{table}"
+        self.status = status
+        self.failures = failures
+        self.retry_after = retry_after
+        self.calls = {"POST": 0, "GET": 0}
+
+    def handle(self, method, raw_path, headers, body):
+        if raw_path.split("?")[0] == self.target and method in self.calls:
+            self.calls[method] += 1
+            if method == "POST" and self.calls["POST"] <= self.failures:
+                extra = {"Retry-After": self.retry_after} if self.retry_after else None
+                return self.json(self.status, {"error": {"message": "Injected"}}, extra)
+        return super().handle(method, raw_path, headers, body)
+
+
+def create_item(client):
+    return deploy_script.create_record_once(client, "sc_cat_item", {"name": "Item"}, "name=Item")
+
+
+def test_429_is_retried_by_the_client_only(connect):
+    mock = FailingCreates("sc_cat_item", 429, failures=10, retry_after="0")
+    with connect(mock, max_retries=2) as client, pytest.raises(deploy_script.requests.HTTPError):
+        create_item(client)
+
+    # Not multiplied by create_record_once's own loop, and nothing to dedupe after a 429
+    assert mock.calls == {"POST": 3, "GET": 0}
+
+
+def test_503_is_retried_after_a_dedupe_check(connect, monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(deploy_script.time, "sleep", sleeps.append)
+    mock = FailingCreates("sc_cat_item", 503, failures=2, retry_after="2")
+    with connect(mock, max_retries=3) as client:
+        create_item(client)
+
+    assert mock.calls == {"POST": 3, "GET": 2}
+    assert len(mock.tables["sc_cat_item"]) == 1
+    # Retry-After is honoured
+    assert len(sleeps) == 2 and all(delay >= 2 for delay in sleeps)
+
+
+def test_lookup_with_duplicate_titles_resolves_every_title(connect):
+    mock = MockServiceNow()
+    for _ in range(5):
+        mock.insert("sc_category", {"title": "Hardware"})
+    software = mock.insert("sc_category", {"title": "Software"})
+
+    with connect(mock) as client:
+        found = deploy_script.lookup_sys_ids(client, "sc_category", ["Hardware", "Software"])
+
+    assert found["Software"] == software["sys_id"]
+    assert mock.tables["sc_category"][found["Hardware"]]["title"] == "Hardware"
+
+
+def test_lookup_fallback_is_not_cached(connect):
+    mock = MockServiceNow()
+    with connect(mock) as client:
+        first = deploy_script.lookup_sys_ids(client, "sc_catalog", ["Missing"], fallback_first=True)["Missing"]
+        cache = deploy_script.load_lookup_cache(client.lookup_cache_path)
+
+    assert first == next(iter(mock.tables["sc_catalog"]))
+    assert not any(key.endswith("|Missing") for key in cache)
@@ -0,0 +1,213 @@
+import textwrap
+
+from extract_tf_vars_to_xml import (
+    BlockIndex, collect_simple_assignments, extract_file, parse_blocks, parse_selector, select_values,
+    selected_name
+)
+
+
+def parse(source):
+    """(content, top-level blocks) for a dedented snippet"""
+    content = textwrap.dedent(source)
+    return content, parse_blocks(content)
+
+
+def index_of(source):
+    content = textwrap.dedent(source)
+    return BlockIndex.from_blocks(content, parse_blocks(content))
+
+
+def assignments(source, block_type):
+    """Assignments of the only top-level block of block_type"""
+    content, blocks = parse(source)
+    matches = [b for b in blocks if b["type"] == block_type]
+    assert len(matches) == 1
+    return collect_simple_assignments(content, matches[0])
+
+
+def test_braces_inside_strings_do_not_open_blocks():
+    values = assignments('''
+        locals {
+          template = "{ not a block }"
+          escaped  = "quote \\" and } brace"
+          after    = "still inside locals"
+        }
+    ''', "locals")
+    assert values == {
+        "template": "{ not a block }",
+        "escaped": 'quote \\" and } brace',
+        "after": "still inside locals",
+    }
+
+
+def test_heredocs_are_single_values():
+    content, blocks = parse('''
+        locals {
+          script = <<EOF
+        resource "fake" "x" {
+          }
+        EOF
+          indented = <<-EOT
+            locals { nope = 1 }
+            EOT
+          after = "ok"
+        }
+    ''')
+    assert [b["type"] for b in blocks] == ["locals"]
+    values = collect_simple_assignments(content, blocks[0])
+    assert values["script"].startswith("<<EOF")
+    assert 'resource "fake"' in values["script"]
+    assert "nope" in values["indented"]
+    assert values["after"] == "ok"
+    assert blocks[0]["children"] == []
+
+
+def test_comments_are_ignored():
+    content, blocks = parse('''
+        # locals { hash = 1 }
+        // locals { slash = 1 }
+        /* locals {
+             block = 1
+           } */
+        locals {
+          kept = "yes" # trailing } comment
+          /* inline */ also = 2
+        }
+    ''')
+    assert len(blocks) == 1
+    assert collect_simple_assignments(content, blocks[0]) == {"kept": "yes", "also": 2}
+
+
+def test_one_line_blocks():
+    content, blocks = parse('''
+        provider "azurerm" {
+          features { skip = true }
+          subscription_id = "sub"
+        }
+        locals { a = 1 }
+    ''')
+    provider, local = blocks
+    assert provider["labels"] == ["azurerm"]
+    assert collect_simple_assignments(content, provider) == {"subscription_id": "sub"}
+    assert collect_simple_assignments(content, provider["children"][0]) == {"skip": True}
+    assert collect_simple_assignments(content, local) == {"a": 1}
+
+
+def test_multi_line_maps_and_lists_are_joined():
+    values = assignments('''
+        locals {
+          tags = {
+            env  = "dev"
+            team = "platform"
+          }
+          zones = [
+            "1",
+            "2",
+          ]
+          next = true
+        }
+    ''', "locals")
+    assert values == {
+        "tags": '{ env  = "dev" team = "platform" }',
+        "zones": '[ "1", "2", ]',
+        "next": True,
+    }
+
+
+def test_nested_blocks_are_children_not_values():
+    content, blocks = parse('''
+        resource "azurerm_windows_virtual_machine" "winvm" {
+          size = "Standard_B2s"
+          os_disk {
+            caching = "ReadWrite"
+          }
+        }
+    ''')
+    vm = blocks[0]
+    assert vm["labels"] == ["azurerm_windows_virtual_machine", "winvm"]
+    assert collect_simple_assignments(content, vm) == {"size": "Standard_B2s"}
+    assert vm["children"][0]["type"] == "os_disk"
+    assert collect_simple_assignments(content, vm["children"][0]) == {"caching": "ReadWrite"}
+
+
+def test_unterminated_block_is_skipped():
+    _, blocks = parse('''
+        locals { a = 1 }
+        resource "x" "y" {
+          b = 2
+    ''')
+    assert [b["type"] for b in blocks] == ["locals"]
+
+
+def test_block_index_paths_and_selectors():
+    index = index_of('''
+        locals {
+          vm_size = "Standard_B2s"
+        }
+        resource "azurerm_windows_virtual_machine" "winvm" {
+          size = local.vm_size
+          os_disk {
+            caching = "ReadWrite"
+          }
+        }
+        resource "azurerm_windows_virtual_machine" "winvm" {
+          size = "Standard_D2s"
+        }
+    ''')
+    assert index.count("resource", "azurerm_windows_virtual_machine") == 2
+    assert index.get("resource.azurerm_windows_virtual_machine.winvm.os_disk.caching") == "ReadWrite"
+    # A repeated block merges into the first; nested blocks are never values
+    assert index.select("resource.azurerm_windows_virtual_machine.winvm.*") == {
+        ("resource", "azurerm_windows_virtual_machine", "winvm", "size"): "Standard_D2s"
+    }
+    assert index.resolve("local.vm_size") == "Standard_B2s"
+    assert index.resolve("var.missing") == "var.missing"
+    assert BlockIndex.from_entry(index.to_entry()).select("*.*") == index.select("*.*")
+
+
+def test_parse_selector():
+    assert parse_selector("resource.x.*.size") == (None, "resource.x.*.size")
+    assert parse_selector("vm_size = resource.x.*.size") == ("vm_size", "resource.x.*.size")
+
+
+def test_selected_name():
+    path = ("resource", "azurerm_windows_virtual_machine", "winvm", "size")
+    selector = "resource.azurerm_windows_virtual_machine.*.size"
+    assert selected_name(None, selector, path, 1) == "azurerm_windows_virtual_machine_winvm_size"
+    assert selected_name("vm_size", selector, path, 1) == "vm_size"
+    assert selected_name("vm_size", selector, path, 2) == "vm_size_winvm"
+    assert selected_name(None, "locals.*", ("locals", "vm_name"), 3) == "vm_name"
+
+
+def test_select_values_resolves_locals_and_skips_provider_credentials():
+    index = index_of('''
+        locals {
+          vm_size = "Standard_B2s"
+        }
+        provider "azurerm" {
+          client_secret = "hunter2"
+          tenant_id     = "tenant"
+          environment   = "public"
+        }
+        resource "azurerm_windows_virtual_machine" "a" {
+          size = local.vm_size
+        }
+        resource "azurerm_windows_virtual_machine" "b" {
+          size = "Standard_D2s"
+        }
+    ''')
+    log = []
+    selected = select_values(index, [
+        ("size", "resource.azurerm_windows_virtual_machine.*.size"),
+        (None, "provider.azurerm.*"),
+    ], log)
+    assert selected == {"size_a": "Standard_B2s", "size_b": "Standard_D2s", "provider_azurerm_environment": "public"}
+    assert len(log) == 2
+
+
+def test_extract_file_keeps_secrets_out_of_selected_locals(tmp_path):
+    tf = tmp_path / "main.tf"
+    tf.write_text('provider "azurerm" {\n  client_secret = "hunter2"\n  client_id = "app"\n}\n')
+    result = extract_file(str(tf), selectors=[(None, "provider.azurerm.*")])
+    assert result["locals"] == {}
+    assert result["provider"] == {"client_secret": "hunter2", "client_id": "app"}